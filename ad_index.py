@@ -0,0 +1,72 @@
+import os
+from typing import Iterable, Iterator, Optional, Set
+from urllib.parse import urlparse, parse_qs
+
+
+def extract_ad_id(url: str) -> Optional[str]:
+    """
+    :param url: URL with mobile.de ad
+    :return: Ad's id (value of id query parameter) or None if URL has no id
+    """
+    ids = parse_qs(urlparse(url).query).get('id')
+    return ids[0] if ids else None
+
+
+class AdIndex:
+    """
+    Set of ids of already scraped ads. If path is given, ids are loaded from it and every added id is appended to it,
+    so ads scraped by previous runs are skipped before they are fetched.
+    """
+
+    def __init__(self, path: str = None):
+        """
+        :param path: [Optional] Path to text file with one ad's id per line, created if missing
+        """
+        self._ids: Set[str] = set()
+        self._file = None
+
+        if path:
+            if os.path.exists(path):
+                with open(path) as file:
+                    self._ids.update(line.strip() for line in file if line.strip())
+            self._file = open(path, 'a', buffering=1)
+
+    def __contains__(self, ad_id: str) -> bool:
+        return ad_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, ad_id: str) -> bool:
+        """
+        :param ad_id: Id of scraped ad
+        :return: True if id was not in the index before
+        """
+        if ad_id in self._ids:
+            return False
+
+        self._ids.add(ad_id)
+        if self._file is not None:
+            self._file.write(ad_id + '\n')
+        return True
+
+    def unique(self, urls: Iterable[str]) -> Iterator[str]:
+        """
+        Single pass, order preserving deduplication of ad's urls. URLs of ads already in the index, repeated ads and
+        URLs without ad's id are dropped. Yielded ads are not added to the index, use add once they are scraped.
+
+        :param urls: Ad's urls
+        :return: Iterator of urls of new, unique ads
+        """
+        seen = set()
+        for url in urls:
+            ad_id = extract_ad_id(url)
+            if ad_id is None or ad_id in seen or ad_id in self._ids:
+                continue
+            seen.add(ad_id)
+            yield url
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,198 @@
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+
+class Vocabulary:
+    """
+    Interned names with stable indexes. Index of a name is its bit position in bitsets built over the vocabulary.
+    """
+    __slots__ = ('names', '_indexes')
+
+    def __init__(self, names: Iterable[str] = ()):
+        """
+        :param names: [Optional] Initial names
+        """
+        self.names: List[str] = []
+        self._indexes: Dict[str, int] = {}
+        for name in names:
+            self.index(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._indexes
+
+    def index(self, name: str) -> int:
+        """
+        :param name: Name, added to the vocabulary if missing
+        :return: Index of the name
+        """
+        index = self._indexes.get(name)
+        if index is None:
+            name = sys.intern(name)
+            index = self._indexes[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def bitset(self, names: Iterable[str]) -> int:
+        """
+        :param names: Names, added to the vocabulary if missing
+        :return: Bitset with bits of given names set
+        """
+        bitset = 0
+        for name in names:
+            bitset |= 1 << self.index(name)
+        return bitset
+
+    def mask(self, names: Iterable[str]) -> Optional[int]:
+        """
+        :param names: Names to look up, vocabulary is not extended
+        :return: Bitset with bits of given names set or None if some name is not in the vocabulary
+        """
+        bitset = 0
+        for name in names:
+            index = self._indexes.get(name)
+            if index is None:
+                return None
+            bitset |= 1 << index
+        return bitset
+
+    def decode(self, bitset: int) -> List[str]:
+        """
+        :param bitset: Bitset built over the vocabulary
+        :return: Names of set bits in index order
+        """
+        names = []
+        while bitset:
+            lowest = bitset & -bitset
+            names.append(self.names[lowest.bit_length() - 1])
+            bitset ^= lowest
+        return names
+
+
+class AdRecord:
+    """
+    Compact form of a scraped ad. Features and technical data keys are arrays of indexes in vocabularies shared by an
+    AdStore, in the ad's order. Features are also kept as a bitset for queries. Technical data values are kept in order
+    of their keys and all strings are interned.
+    """
+    __slots__ = ('id', 'title', 'loc', 'features', 'feature_bits', 'technical_keys', 'technical_values')
+
+    def __init__(self, ad_id: Union[int, str, None], title: str, loc: str, features: Optional[array],
+                 feature_bits: int, technical_keys: Optional[array], technical_values: tuple):
+        self.id = ad_id
+        self.title = title
+        self.loc = loc
+        self.features = features
+        self.feature_bits = feature_bits
+        self.technical_keys = technical_keys
+        self.technical_values = technical_values
+
+    def __repr__(self) -> str:
+        return f'AdRecord(id={self.id!r}, title={self.title!r})'
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class AdStore:
+    """
+    In-memory collection of scraped ads kept as AdRecords. Iterating the store yields ads equal to the added ones, in
+    the same form as scrape_car returns them.
+    """
+
+    def __init__(self, ads: Iterable[Dict] = ()):
+        """
+        :param ads: [Optional] Initial ads, as returned by scrape_car
+        """
+        self.features = Vocabulary()
+        self.technical_keys = Vocabulary()
+        self.records: List[AdRecord] = []
+        for ad in ads:
+            self.add(ad)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (self.decode(record) for record in self.records)
+
+    def add(self, ad: Dict) -> AdRecord:
+        """
+        :param ad: Scraped ad, as returned by scrape_car
+        :return: Compact record of the ad, stored in the store
+        """
+        record = self.encode(ad)
+        self.records.append(record)
+        return record
+
+    def encode(self, ad: Dict) -> AdRecord:
+        """
+        :param ad: Scraped ad, as returned by scrape_car
+        :return: Compact record of the ad using store's vocabularies
+        """
+        ad_id = ad.get('id')
+        # Only ids which are rendered back the same way are kept as ints
+        if isinstance(ad_id, str) and ad_id.isdigit() and str(int(ad_id)) == ad_id:
+            ad_id = int(ad_id)
+
+        features, feature_bits = None, 0
+        if ad.get('rbt_features') is not None:
+            features = array('H', (self.features.index(name) for name in ad['rbt_features']))
+            feature_bits = self.features.bitset(ad['rbt_features'])
+
+        technical_keys, technical_values = None, ()
+        if ad.get('technical_data') is not None:
+            technical_keys = array('H', (self.technical_keys.index(key) for key in ad['technical_data']))
+            technical_values = tuple(_intern(value) for value in ad['technical_data'].values())
+
+        return AdRecord(ad_id, _intern(ad.get('title')), _intern(ad.get('loc')), features, feature_bits,
+                        technical_keys, technical_values)
+
+    def decode(self, record: AdRecord) -> Dict:
+        """
+        :param record: Record created by this store
+        :return: Ad in the form returned by scrape_car
+        """
+        technical_data = None
+        if record.technical_keys is not None:
+            keys = [self.technical_keys.names[index] for index in record.technical_keys]
+            technical_data = dict(zip(keys, record.technical_values))
+
+        features = None
+        if record.features is not None:
+            features = [self.features.names[index] for index in record.features]
+
+        return {
+            'id': str(record.id) if isinstance(record.id, int) else record.id,
+            'title': record.title,
+            'rbt_features': features,
+            'technical_data': technical_data,
+            'loc': record.loc
+        }
+
+    def with_features(self, *names: str) -> Iterator[AdRecord]:
+        """
+        :param names: Feature names
+        :return: Records of ads having all given features
+        """
+        mask = self.features.mask(names)
+        if mask is None:
+            return iter(())
+        return (record for record in self.records if record.feature_bits & mask == mask)
+
+    def feature_counts(self) -> Dict[str, int]:
+        """
+        :return: Number of ads having every feature
+        """
+        counts = [0] * len(self.features)
+        for record in self.records:
+            bitset = record.feature_bits
+            while bitset:
+                lowest = bitset & -bitset
+                counts[lowest.bit_length() - 1] += 1
+                bitset ^= lowest
+        return dict(zip(self.features.names, counts))
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SEARCH_FIXTURE = 'search.html'
+AD_FIXTURE = 'ad.html'
+
+AD_LINK_PATTERN = re.compile(r'https://suchen\.mobile\.de/fahrzeuge/details\.html\?id=\d+')
+PAGE_BUTTON_PATTERN = re.compile(r'(<span class="btn btn--muted btn--s"[^>]*>)(\d+)(</span>)')
+BLOCKED_PAGE = '<!DOCTYPE html><html><head><title>Access denied</title></head><body></body></html>'
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MockSite:
+    """
+    Local stand-in of mobile.de serving recorded search and ad pages. Links of search pages are rewritten to point to
+    the mock and to be unique across pages, so a search has `pages` pages with distinct ads. Every response may be
+    delayed, fail with an error status or be replaced by an empty (blocked) page.
+    """
+
+    def __init__(self, fixtures_dir: str = FIXTURES_DIR, pages: Optional[int] = None, latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503, block_rate: float = 0.0,
+                 seed: int = 0, validators: bool = False):
+        """
+        :param fixtures_dir: Directory with search.html and ad.html fixtures
+        :param pages: [Optional] Number of search pages, by default as many as the fixture's pagination shows
+        :param latency: Mean delay of every response in seconds
+        :param jitter: Max random deviation from mean delay in seconds
+        :param error_rate: Fraction of responses failing with error_status
+        :param error_status: Status of injected errors
+        :param block_rate: Fraction of responses replaced by an empty page
+        :param seed: Seed of injected delays and failures
+        :param validators: If True ad pages have ETag and conditional requests with matching ETag get 304
+        """
+        with open(os.path.join(fixtures_dir, SEARCH_FIXTURE), encoding='utf-8') as file:
+            self.search_page = file.read()
+        with open(os.path.join(fixtures_dir, AD_FIXTURE), encoding='utf-8') as file:
+            self.ad_page = file.read().encode('utf-8')
+
+        self.pages = pages or max(int(match.group(2)) for match in PAGE_BUTTON_PATTERN.finditer(self.search_page))
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.block_rate = block_rate
+        self.etag = f'"{hashlib.sha1(self.ad_page).hexdigest()}"' if validators else None
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    @property
+    def search_url(self) -> str:
+        """
+        :return: URL of the mocked search (without page selection)
+        """
+        return f'{self.base_url}/fahrzeuge/search.html?isSearchRequest=true'
+
+    @property
+    def ads_number(self) -> int:
+        return self.pages * len(AD_LINK_PATTERN.findall(self.search_page))
+
+    def start(self) -> 'MockSite':
+        """
+        Serve pages on a free local port from a background thread
+        """
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _Server(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name='mock-site', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _render_search_page(self, page_n: int) -> bytes:
+        ad_n = iter(range(page_n * 1000, (page_n + 1) * 1000))
+        content = AD_LINK_PATTERN.sub(
+            lambda match: f'{self.base_url}/suchen.mobile.de/fahrzeuge/details.html?id={next(ad_n)}', self.search_page
+        )
+        # Last button shows the number of pages, like on mobile.de
+        buttons_number = len(PAGE_BUTTON_PATTERN.findall(content))
+        buttons = iter([min(n, self.pages) for n in range(1, buttons_number)] + [self.pages])
+        content = PAGE_BUTTON_PATTERN.sub(lambda match: f'{match.group(1)}{next(buttons)}{match.group(3)}', content)
+        return content.encode('utf-8')
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            draw = self._random.random()
+
+        time.sleep(delay)
+
+        if draw < self.error_rate:
+            request.send_response(self.error_status)
+            request.send_header('Content-Length', '0')
+            request.end_headers()
+            return
+
+        url = urlparse(request.path)
+        if draw < self.error_rate + self.block_rate:
+            body = BLOCKED_PAGE.encode('utf-8')
+        elif url.path.endswith('search.html'):
+            page_n = int(parse_qs(url.query).get('pageNumber', ['1'])[0])
+            body = self._render_search_page(page_n) if page_n <= self.pages else BLOCKED_PAGE.encode('utf-8')
+        elif self.etag is not None and request.headers.get('If-None-Match') == self.etag:
+            request.send_response(304)
+            request.send_header('ETag', self.etag)
+            request.end_headers()
+            return
+        else:
+            body = self.ad_page
+
+        request.send_response(200)
+        if self.etag is not None and body is self.ad_page:
+            request.send_header('ETag', self.etag)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
@@ -0,0 +1,49 @@
+import argparse
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fetcher import get  # noqa: E402
+from mock_server import FIXTURES_DIR, SEARCH_FIXTURE, AD_FIXTURE  # noqa: E402
+from parsers import get_parser  # noqa: E402
+
+
+def record(search_url: str, directory: str = FIXTURES_DIR):
+    """
+    Replace fixtures with live pages: the first page of given search and its first ad
+
+    :param search_url: URL to page with search results
+    :param directory: Directory with fixtures
+    """
+    search_page = get(search_url)
+    ads_urls = get_parser().parse_ads_urls(search_page)
+    if not ads_urls:
+        raise ValueError(f'No ads found under {search_url}, page was not recorded')
+    ad_page = get(ads_urls[0])
+
+    for name, content in ((SEARCH_FIXTURE, search_page), (AD_FIXTURE, ad_page)):
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+            file.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Record benchmark fixtures from mobile.de')
+    parser.add_argument(
+        'search_url',
+        help="URL to page with search results",
+        type=str
+    )
+    parser.add_argument(
+        '--fixtures-dir',
+        help="Directory with fixtures",
+        type=str,
+        default=FIXTURES_DIR
+    )
+    args = parser.parse_args()
+    record(args.search_url, args.fixtures_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from ad_index import AdIndex  # noqa: E402
+from fetcher import configure_fetcher  # noqa: E402
+from main import crawl, extract_unique_ads  # noqa: E402
+from mock_server import MockSite, FIXTURES_DIR, SEARCH_FIXTURE, AD_FIXTURE  # noqa: E402
+from parsers import configure_parser, create_parser, extract_technical_data, BS4, LXML, \
+    TECHNICAL_DATA_CLASS  # noqa: E402
+from sinks import Sink  # noqa: E402
+
+AD_URL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=300000000'
+UNIQUE_SIZES = (1000, 10000, 100000)
+DUPLICATES_RATIO = 0.1
+DEFAULT_TOLERANCE = 0.2
+
+# Metrics compared with baseline, by suffix: True if higher values are better
+METRIC_DIRECTIONS = {'_per_second': True, '_ms': False, '_us': False, '_seconds': False, '_bytes': False}
+
+
+class CountingSink(Sink):
+    """
+    Discards ads, only counts them
+    """
+
+    def __init__(self):
+        self.written = 0
+
+    def write(self, record: Dict) -> List[str]:
+        self.written += 1
+        return [record['id']]
+
+
+def _median_seconds(function: Callable, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def _read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def benchmark_parsing(repeat: int) -> Dict[str, float]:
+    """
+    :param repeat: Number of repetitions, median is reported
+    :return: Parse times of a single page with every parser backend and of legacy extract_technical_data
+    """
+    search_page = _read_fixture(SEARCH_FIXTURE)
+    ad_page = _read_fixture(AD_FIXTURE)
+    results = {}
+
+    for name in (LXML, BS4):
+        parser = create_parser(name)
+        if parser.name != name:
+            continue
+        results[f'{name}_parse_car_ms'] = 1000 * _median_seconds(lambda: parser.parse_car(AD_URL, ad_page), repeat)
+        results[f'{name}_parse_ads_urls_ms'] = 1000 * _median_seconds(
+            lambda: parser.parse_ads_urls(search_page), repeat
+        )
+        results[f'{name}_parse_number_of_results_ms'] = 1000 * _median_seconds(
+            lambda: parser.parse_number_of_results(search_page), repeat
+        )
+
+    technical_data = BeautifulSoup(ad_page, features='html.parser').find('div', class_=TECHNICAL_DATA_CLASS)
+    results['extract_technical_data_ms'] = 1000 * _median_seconds(
+        lambda: extract_technical_data(technical_data), repeat
+    )
+    return results
+
+
+def benchmark_unique(sizes: List[int]) -> Dict[str, float]:
+    """
+    :param sizes: Numbers of ad's urls
+    :return: Time of extract_unique_ads per url for every size, a tenth of urls are duplicates
+    """
+    results = {}
+    for size in sizes:
+        unique_number = int(size * (1 - DUPLICATES_RATIO))
+        urls = [f'https://suchen.mobile.de/fahrzeuge/details.html?id={n % unique_number}' for n in range(size)]
+        seconds = _median_seconds(lambda: extract_unique_ads(urls), 3)
+        results[f'unique_{size}_per_url_us'] = 1e6 * seconds / size
+    return results
+
+
+def benchmark_end_to_end(site: MockSite, max_concurrency: int, parser_name: str,
+                         trace_memory: bool = False) -> Dict[str, float]:
+    """
+    Crawl the whole mocked search: paginate search pages, fetch and parse every ad
+
+    :param site: Started mock site
+    :param max_concurrency: Max number of concurrent requests
+    :param parser_name: Parser backend
+    :param trace_memory: If True peak memory is measured, which slows the crawl down
+    :return: Throughput (or peak memory) of the crawl
+    """
+    configure_parser(parser_name)
+    configure_fetcher(max_concurrency=max_concurrency, requests_per_second=None, backoff_factor=0.05)
+    sink = CountingSink()
+    requests_before = site.requests
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    crawl([site.search_url], ad_index=AdIndex(), sink=sink)
+    seconds = time.perf_counter() - started
+
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'crawl_peak_memory_bytes': peak}
+
+    return {
+        'ads': sink.written,
+        'ads_expected': site.ads_number,
+        'requests': site.requests - requests_before,
+        'crawl_seconds': seconds,
+        'ads_per_second': sink.written / seconds,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """
+    :param results: Results of the current run
+    :param baseline: Results of a previous run
+    :param tolerance: Allowed relative change for the worse
+    :return: Descriptions of metrics which got worse by more than tolerance
+    """
+    regressions = []
+    for group, metrics in results.items():
+        for name, value in metrics.items():
+            previous = baseline.get(group, {}).get(name)
+            higher_is_better = next(
+                (direction for suffix, direction in METRIC_DIRECTIONS.items() if name.endswith(suffix)), None
+            )
+            if previous is None or higher_is_better is None or not previous:
+                continue
+
+            change = (value - previous) / previous
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f'{group}.{name}: {previous:.4g} -> {value:.4g} ({change:+.0%})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the scraper against a local mock of mobile.de')
+    parser.add_argument(
+        '--output',
+        help="Path to JSON report, printed to stdout if not set",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--baseline',
+        help="Path to JSON report of a previous run, exit code is 1 if any metric got worse by more than tolerance",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--tolerance',
+        help="Allowed relative change for the worse compared with baseline",
+        type=float,
+        default=DEFAULT_TOLERANCE
+    )
+    parser.add_argument(
+        '--repeat',
+        help="Number of repetitions of parse benchmarks",
+        type=int,
+        default=20
+    )
+    parser.add_argument(
+        '--pages',
+        help="Number of search pages of the mocked search (20 ads each)",
+        type=int,
+        default=10
+    )
+    parser.add_argument(
+        '--latency',
+        help="Mean latency of mocked responses in seconds",
+        type=float,
+        default=0.05
+    )
+    parser.add_argument(
+        '--jitter',
+        help="Max random deviation from mean latency in seconds",
+        type=float,
+        default=0.02
+    )
+    parser.add_argument(
+        '--error-rate',
+        help="Fraction of mocked responses failing with 503",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--block-rate',
+        help="Fraction of mocked responses replaced by an empty page",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        help="Max number of concurrent requests of the crawl",
+        type=int,
+        default=8
+    )
+    parser.add_argument(
+        '--parser',
+        help="Parser backend of the crawl",
+        choices=[LXML, BS4],
+        default=LXML
+    )
+    parser.add_argument(
+        '--skip',
+        help="Benchmark groups to skip",
+        choices=['parsing', 'unique', 'end_to_end', 'memory'],
+        nargs='*',
+        default=[]
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    results = {}
+    if 'parsing' not in args.skip:
+        results['parsing'] = benchmark_parsing(args.repeat)
+    if 'unique' not in args.skip:
+        results['unique'] = benchmark_unique(list(UNIQUE_SIZES))
+
+    site = MockSite(pages=args.pages, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    block_rate=args.block_rate).start()
+    try:
+        if 'end_to_end' not in args.skip:
+            results['end_to_end'] = benchmark_end_to_end(site, args.max_concurrency, args.parser)
+        if 'memory' not in args.skip:
+            results['memory'] = benchmark_end_to_end(site, args.max_concurrency, args.parser, trace_memory=True)
+    finally:
+        site.stop()
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    # Crawl which missed ads is a failure regardless of its speed
+    errors = [f'{name} scraped {result["ads"]} ads, expected {result["ads_expected"]}'
+              for name, result in results.items()
+              if 'ads_expected' in result and result['ads'] != result['ads_expected']]
+    if args.baseline:
+        with open(args.baseline) as file:
+            errors += [f'Regression: {regression}'
+                       for regression in compare(results, json.load(file)['results'], args.tolerance)]
+    for error in errors:
+        logging.error(error)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
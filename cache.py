@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+from search_filter import canonical_search_url
+
+DEFAULT_SEARCH_TTL = 60 * 60
+DEFAULT_AD_TTL = 24 * 60 * 60
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+CACHE_FILE_NAME = 'responses.sqlite'
+
+SEARCH_PAGE = 'search'
+AD_PAGE = 'ad'
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalize URL so that equivalent URLs share cache entry. Search pages have canonical_search_url form (the same
+    as memoized counts), in other URLs query parameters are sorted and fragment is dropped.
+
+    :param url: URL to normalize
+    :return: Normalized URL
+    """
+    if page_kind(url) == SEARCH_PAGE:
+        try:
+            return canonical_search_url(url)
+        except ValueError:
+            pass
+
+    parsed = urlparse(url)
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if not (key == 'pageNumber' and value == '1')
+    )
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, parsed.params, urlencode(query), ''))
+
+
+def page_kind(url: str) -> str:
+    """
+    :param url: URL of mobile.de page
+    :return: SEARCH_PAGE for pages with search results, AD_PAGE otherwise
+    """
+    return SEARCH_PAGE if urlparse(url).path.endswith('search.html') else AD_PAGE
+
+
+class ResponseCache:
+    """
+    Persistent cache of page contents kept in a single SQLite file. Contents are stored zlib compressed, expire after
+    TTL depending on page kind and least recently used entries are evicted when cache grows over max size.
+    Safe to share between threads and processes.
+    """
+
+    def __init__(self, directory: str, search_ttl: float = DEFAULT_SEARCH_TTL, ad_ttl: float = DEFAULT_AD_TTL,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        """
+        :param directory: Directory with cache file, created if missing
+        :param search_ttl: Time to live of search pages in seconds
+        :param ad_ttl: Time to live of ad pages in seconds
+        :param max_size: Max total size of compressed contents in bytes
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.ttl = {SEARCH_PAGE: search_ttl, AD_PAGE: ad_ttl}
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(directory, CACHE_FILE_NAME), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'url TEXT PRIMARY KEY, kind TEXT NOT NULL, content BLOB NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._size = self._total_size()
+
+    def get(self, url: str) -> Optional[str]:
+        """
+        :param url: URL of the page
+        :return: Cached content or None if page is missing or expired
+        """
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT kind, content, created_at FROM responses WHERE url = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            kind, content, created_at = row
+            if now - created_at > self.ttl[kind]:
+                self._connection.execute('DELETE FROM responses WHERE url = ?', (key,))
+                return None
+
+            self._connection.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, key))
+
+        return zlib.decompress(content).decode('utf-8')
+
+    def put(self, url: str, content: str):
+        """
+        Store page content and evict least recently used pages if cache is too big
+
+        :param url: URL of the page
+        :param content: Content of the page
+        """
+        key = normalize_url(url)
+        compressed = zlib.compress(content.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (url, kind, content, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, page_kind(key), compressed, len(compressed), now, now)
+            )
+            self._size += len(compressed)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _total_size(self) -> int:
+        return self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _evict(self):
+        # Size is only estimated between evictions (replaced entries and other processes are not tracked)
+        total_size = self._total_size()
+
+        rows = self._connection.execute('SELECT url, size FROM responses ORDER BY accessed_at')
+        evicted = []
+        for url, size in rows:
+            if total_size <= self.max_size:
+                break
+            evicted.append((url,))
+            total_size -= size
+
+        self._connection.executemany('DELETE FROM responses WHERE url = ?', evicted)
+        self._size = total_size
+
+    def delete(self, url: str):
+        """
+        Remove page from cache, ex. when its content turned out to be a block page
+
+        :param url: URL of the page
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM responses WHERE url = ?', (normalize_url(url),))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
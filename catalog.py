@@ -0,0 +1,171 @@
+import difflib
+import logging
+import re
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from consts import CAR_BRANDS, BRAND_CODE, BRAND_TYPES, GENERAL_CODE, SUB_CODES
+
+FUZZY_CUTOFF = 0.8
+
+
+class Model(NamedTuple):
+    """
+    Searchable car model. Code is a model's id, series' general code (like ';20') or None for the whole brand.
+    """
+    brand: str
+    name: Optional[str]
+    brand_code: int
+    code: Union[int, str, None]
+    series: Optional[str] = None
+
+    @property
+    def is_series(self) -> bool:
+        return isinstance(self.code, str)
+
+
+def _key(name: str) -> str:
+    return re.sub(r'[^0-9a-z]+', '', name.lower())
+
+
+def _lookup(name: str, index: Mapping[str, str], kind: str, fuzzy: bool) -> str:
+    key = _key(name)
+    if key in index:
+        return index[key]
+
+    if fuzzy:
+        prefixed = sorted({value for candidate, value in index.items() if candidate.startswith(key)}) if key else []
+        if len(prefixed) > 1:
+            # Ambiguous prefix is not resolved by close matches, which would pick one of the candidates arbitrarily
+            raise ValueError(f'Ambiguous {kind} {name}, did you mean: {", ".join(prefixed)}?')
+        close = difflib.get_close_matches(key, list(index), n=1, cutoff=FUZZY_CUTOFF)
+        value = prefixed[0] if prefixed else index[close[0]] if close else None
+        if value is not None:
+            logging.warning(f'Inexact {kind} {name} resolved to {value}')
+            return value
+
+    suggestions = difflib.get_close_matches(key, list(index), n=3, cutoff=0.5)
+    hint = f', did you mean: {", ".join(index[suggestion] for suggestion in suggestions)}?' if suggestions else ''
+    raise ValueError(f'Unknown {kind} {name}{hint}')
+
+
+class Catalog:
+    """
+    Immutable index of brands and models. Brands in CAR_BRANDS are either bare brand codes or dicts of models, where
+    a model is an id or a series with a general code and ids of its submodels. All shapes are flattened into Models
+    once, so lookups don't walk nested dicts. Names are matched case and punctuation insensitive and, optionally,
+    fuzzy.
+    """
+
+    def __init__(self, car_brands: Dict):
+        """
+        :param car_brands: Brands in the format of consts.CAR_BRANDS
+        """
+        brands: Dict[str, str] = {}
+        brand_codes: Dict[str, int] = {}
+        models: Dict[str, List[Model]] = {}
+        names: Dict[str, Dict[str, str]] = {}
+        by_name: Dict[Tuple[str, str], Model] = {}
+        by_code: Dict[Tuple[int, Union[int, str, None]], Model] = {}
+
+        for brand, definition in car_brands.items():
+            if isinstance(definition, int):
+                brand_code, brand_types = definition, {}
+            else:
+                brand_code, brand_types = definition[BRAND_CODE], definition[BRAND_TYPES]
+
+            brands[_key(brand)] = brand
+            brand_codes[brand] = brand_code
+            models[brand] = []
+            names[brand] = {}
+            entries = [Model(brand, None, brand_code, None)]
+
+            for name, code in brand_types.items():
+                if isinstance(code, dict):
+                    entries.append(Model(brand, name, brand_code, code[GENERAL_CODE]))
+                    entries.extend(
+                        Model(brand, sub_name, brand_code, sub_code, series=name)
+                        for sub_name, sub_code in code[SUB_CODES].items()
+                    )
+                else:
+                    entries.append(Model(brand, name, brand_code, code))
+
+            for model in entries:
+                by_code.setdefault((brand_code, model.code), model)
+                if model.name is None:
+                    continue
+                models[brand].append(model)
+                names[brand].setdefault(_key(model.name), model.name)
+                by_name.setdefault((brand, model.name), model)
+
+        self._brands = MappingProxyType(brands)
+        self._brand_codes = MappingProxyType(brand_codes)
+        self._models = MappingProxyType({brand: tuple(entries) for brand, entries in models.items()})
+        self._names = MappingProxyType({brand: MappingProxyType(index) for brand, index in names.items()})
+        self._by_name = MappingProxyType(by_name)
+        self._by_code = MappingProxyType(by_code)
+
+    @property
+    def brands(self) -> Tuple[str, ...]:
+        return tuple(self._brand_codes)
+
+    def find_brand(self, name: str, fuzzy: bool = True) -> str:
+        """
+        :param name: Brand name, ex. "Mercedes"
+        :param fuzzy: [Optional] If True unique prefixes and close misspellings are accepted
+        :return: Brand name as in the catalog, ex. "mercedes-benz"
+        """
+        return _lookup(name, self._brands, 'car brand', fuzzy)
+
+    def find(self, brand: str, model: Optional[str] = None, fuzzy: bool = True) -> Model:
+        """
+        :param brand: Brand name
+        :param model: [Optional] Model or series name, whole brand if not given
+        :param fuzzy: [Optional] If True unique prefixes and close misspellings are accepted
+        :return: Searchable model
+        """
+        brand = self.find_brand(brand, fuzzy)
+        if model is None:
+            return self._by_code[(self._brand_codes[brand], None)]
+        return self._by_name[(brand, _lookup(model, self._names[brand], f'{brand} model', fuzzy))]
+
+    def models(self, brand: str) -> Tuple[Model, ...]:
+        """
+        :param brand: Brand name
+        :return: All models of the brand: standalone models, series and their submodels
+        """
+        return self._models[self.find_brand(brand)]
+
+    def expand(self, brand: str, model: Optional[str] = None) -> Tuple[Model, ...]:
+        """
+        Split a search into the most specific models: series into submodels and a brand into all its models. Brand
+        without known models is returned as a whole.
+
+        :param brand: Brand name
+        :param model: [Optional] Model or series name, whole brand if not given
+        :return: Models with ids, which together cover the search
+        """
+        found = self.find(brand, model)
+        if found.name is None:
+            candidates: Iterable[Model] = self._models[found.brand]
+        elif found.is_series:
+            candidates = (candidate for candidate in self._models[found.brand] if candidate.series == found.name)
+        else:
+            return found,
+
+        expanded = tuple(candidate for candidate in candidates if not candidate.is_series)
+        return expanded or (found,)
+
+    def name_of(self, brand_code: int, code: Union[int, str, None] = None) -> Model:
+        """
+        :param brand_code: Brand's id
+        :param code: [Optional] Model's id or series' general code
+        :return: Model with given codes
+        """
+        try:
+            return self._by_code[(brand_code, code)]
+        except KeyError:
+            raise ValueError(f'Unknown car model code {brand_code};{code}') from None
+
+
+CATALOG = Catalog(CAR_BRANDS)
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+from fetcher import get
+from metrics import COUNT_PROBES
+from parsers import get_parser
+from search_filter import canonical_search_url
+
+DEFAULT_COUNT_TTL = 6 * 60 * 60
+COUNTS_FILE_NAME = 'counts.sqlite'
+
+# Parameters which change order or page of results, but not their number
+NON_FILTER_ARGS = ('pageNumber', 'sortOption.sortBy', 'sortOption.sortOrder')
+
+
+def count_key(url: str) -> str:
+    """
+    :param url: URL to page with search results
+    :return: Canonical form of search's filters: canonical_search_url without pagination and sorting
+    """
+    parsed = urlparse(url)
+    query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+             if key not in NON_FILTER_ARGS]
+    url = urlunparse((parsed.scheme, parsed.netloc, parsed.path, parsed.params, urlencode(query), ''))
+    try:
+        return canonical_search_url(url, with_page=False)
+    except ValueError:
+        return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, parsed.params,
+                           urlencode(sorted(query)), ''))
+
+
+class CountProbe:
+    """
+    Memoized numbers of search results. Counts are keyed by canonical filter set, so the same search is probed once
+    regardless of parameters order, sorting and page. Counts expire after TTL and are optionally persisted in SQLite
+    file, so they are shared by runs. Missing counts (headline not found) are not memoized.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_COUNT_TTL,
+                 probe: Callable[[str], Optional[int]] = None):
+        """
+        :param path: [Optional] Path to SQLite file with counts, counts are kept only in memory if not set
+        :param ttl: Time to live of counts in seconds
+        :param probe: [Optional] Function returning number of results of a search URL, by default search page is
+                      fetched and its headline parsed
+        """
+        self.ttl = ttl
+        self.probe = probe if probe is not None else self._probe
+        self.hits = 0
+        self.misses = 0
+        self._counts: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._connection = None
+
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS counts (search TEXT PRIMARY KEY, count INTEGER NOT NULL, '
+                'probed_at REAL NOT NULL)'
+            )
+            self._connection.execute('DELETE FROM counts WHERE probed_at < ?', (time.time() - ttl,))
+            self._counts = {
+                search: (count, probed_at)
+                for search, count, probed_at in self._connection.execute('SELECT search, count, probed_at FROM counts')
+            }
+
+    @staticmethod
+    def _probe(url: str) -> Optional[int]:
+        return get_parser().parse_number_of_results(get(url))
+
+    def count(self, url: str) -> Optional[int]:
+        """
+        :param url: URL to page with search results
+        :return: Number of search results or None if it couldn't be found
+        """
+        key = count_key(url)
+        now = time.time()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None and now - cached[1] <= self.ttl:
+                self.hits += 1
+                COUNT_PROBES.inc(result='hit')
+                return cached[0]
+            self.misses += 1
+        COUNT_PROBES.inc(result='miss')
+
+        count = self.probe(url)
+        if count is None:
+            return None
+
+        with self._lock:
+            self._counts[key] = (count, now)
+            if self._connection is not None:
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO counts (search, count, probed_at) VALUES (?, ?, ?)', (key, count, now)
+                )
+        return count
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_count_probe: Optional[CountProbe] = None
+
+
+def configure_count_probe(path: Optional[str] = None, ttl: float = DEFAULT_COUNT_TTL):
+    """
+    Replace shared count probe, used by URLCreator
+
+    :param path: [Optional] Path to SQLite file with counts, counts are kept only in memory if not set
+    :param ttl: Time to live of counts in seconds
+    """
+    global _count_probe
+    if _count_probe is not None:
+        _count_probe.close()
+    _count_probe = CountProbe(path, ttl)
+
+
+def get_count_probe() -> CountProbe:
+    """
+    :return: Shared count probe, keeping counts only in memory if not configured
+    """
+    global _count_probe
+    if _count_probe is None:
+        _count_probe = CountProbe()
+    return _count_probe
@@ -0,0 +1,138 @@
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+START = 'start'
+END = 'end'
+
+EXACT = 'exact'
+TOKEN = 'token'
+
+
+class FieldSpec(NamedTuple):
+    """
+    Declarative description of a page field: element with given tag whose attribute matches value. Single class
+    matches any of element's classes (TOKEN), several classes match the whole attribute (EXACT), like in
+    BeautifulSoup. Field with scope is searched only inside elements matched by the scope field.
+    """
+    name: str
+    tag: str
+    attribute: str
+    value: str
+    many: bool = False
+    scope: Optional[str] = None
+
+    @property
+    def match(self) -> str:
+        return TOKEN if self.attribute == 'class' and ' ' not in self.value else EXACT
+
+
+class Match(NamedTuple):
+    element: Any
+    parent: Optional[int]
+
+
+class FieldStats:
+    """
+    Extraction cost of a single field: number of tested and matched elements and time spent on tests
+    """
+    __slots__ = ('tested', 'matched', 'seconds')
+
+    def __init__(self):
+        self.tested = 0
+        self.matched = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {'tested': self.tested, 'matched': self.matched, 'seconds': self.seconds}
+
+
+class Extractor:
+    """
+    Resolves all fields of a spec in a single traversal of the document. Traversal is given as a sequence of start and
+    end events, so the same spec works with every parser backend. Only elements with a tag used by the spec are tested
+    and fields which need a single match stop being tested after the first one.
+    """
+
+    def __init__(self, specs: Iterable[FieldSpec], profile: bool = False):
+        """
+        :param specs: Fields to extract, scope fields have to be listed before fields using them
+        :param profile: If True time spent on every field is measured, counts are always collected
+        """
+        self.specs = tuple(specs)
+        self.profile = profile
+        self.stats: Dict[str, FieldStats] = {spec.name: FieldStats() for spec in self.specs}
+        self._scopes = {spec.scope for spec in self.specs if spec.scope is not None}
+        self._specs_by_tag: Dict[str, List[FieldSpec]] = defaultdict(list)
+        for spec in self.specs:
+            self._specs_by_tag[spec.tag].append(spec)
+
+    @property
+    def tags(self) -> Tuple[str, ...]:
+        return tuple(self._specs_by_tag)
+
+    def extract(self, events: Iterable[Tuple[str, Any]], tag: Callable[[Any], str],
+                attribute: Callable[[Any, str], Optional[str]]) -> Dict[str, List[Match]]:
+        """
+        :param events: Start and end events of document's elements in document order
+        :param tag: Function returning element's tag name
+        :param attribute: Function returning element's attribute value (classes joined with single spaces)
+        :return: Matches of every field, in document order. Match's parent is an index of enclosing scope's match
+        """
+        matches: Dict[str, List[Match]] = {spec.name: [] for spec in self.specs}
+        open_scopes: Dict[str, List[Tuple[Any, int]]] = defaultdict(list)
+        closing: Dict[int, List[str]] = defaultdict(list)
+        done = set()
+
+        for event, element in events:
+            if event == END:
+                for name in closing.pop(id(element), ()):
+                    open_scopes[name].pop()
+                continue
+
+            specs = self._specs_by_tag.get(tag(element))
+            if not specs:
+                continue
+
+            opened = []
+            for spec in specs:
+                if spec.name in done or (spec.scope is not None and not open_scopes[spec.scope]):
+                    continue
+
+                stats = self.stats[spec.name]
+                started = time.perf_counter() if self.profile else 0
+                stats.tested += 1
+                is_match = self._matches(spec, attribute(element, spec.attribute))
+                if self.profile:
+                    stats.seconds += time.perf_counter() - started
+                if not is_match:
+                    continue
+
+                stats.matched += 1
+                parent = open_scopes[spec.scope][-1][1] if spec.scope is not None else None
+                matches[spec.name].append(Match(element, parent))
+                if spec.name in self._scopes:
+                    opened.append(spec.name)
+                if not spec.many:
+                    done.add(spec.name)
+
+            # Scopes are opened after all tests, so element is never matched inside its own scope
+            for name in opened:
+                open_scopes[name].append((element, len(matches[name]) - 1))
+                closing[id(element)].append(name)
+
+        return matches
+
+    @staticmethod
+    def _matches(spec: FieldSpec, value: Optional[str]) -> bool:
+        if value is None:
+            return False
+        if spec.match == TOKEN:
+            return spec.value in value.split()
+        return ' '.join(value.split()) == spec.value
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: Extraction cost of every field accumulated over all extractions
+        """
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
@@ -0,0 +1,460 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import ResponseCache, page_kind, AD_PAGE
+from metrics import BLOCK_SIGNALS, CACHE_REQUESTS, DOWNLOADED_BYTES, FETCH_ERRORS, FETCH_SECONDS, NOT_MODIFIED, \
+    RESPONSES
+from revalidation import RevalidationStore, LISTING, VALIDATORS
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_REQUESTS_PER_SECOND = 4.0
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_MAX_BACKOFF = 60.0
+DEFAULT_TIMEOUT = (5.0, 30.0)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+BLOCK_STATUSES = frozenset({403, 429, 503})
+
+DEFAULT_RATE_INCREASE = 0.1
+DEFAULT_RATE_DECREASE_FACTOR = 0.5
+DEFAULT_LATENCY_SPIKE_FACTOR = 3.0
+DEFAULT_DECREASE_COOLDOWN = 5.0
+LATENCY_SMOOTHING = 0.1
+
+NOT_MODIFIED_STATUS = 304
+
+HEADERS = {
+    'authority': 'suchen.mobile.de',
+    'scheme': 'https',
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+    'accept-encoding': 'gzip, deflate, br',
+    'accept-language': 'en-GB,en-US;q=0.9,en;q=0.8',
+    'cache-control': 'max-age=0',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'same-origin',
+    'sec-fetch-user': '?1',
+    'upgrade-insecure-requests': '1',
+    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.135 Safari/537.36'
+}
+
+
+class NotModified(Exception):
+    """
+    Ad's page didn't change since it was scraped last time, so it was not downloaded
+    """
+
+    def __init__(self, url: str, reason: str):
+        """
+        :param url: URL of the page
+        :param reason: LISTING if ad's summary in search results didn't change (no request was sent) or VALIDATORS if
+        server answered conditional request with 304
+        """
+        super().__init__(f'{url} not modified ({reason})')
+        self.url = url
+        self.reason = reason
+
+
+class AdaptiveRateController:
+    """
+    AIMD (additive increase, multiplicative decrease) controller of per host request rates. Every healthy response
+    raises host's rate so that it grows by `increase` requests per second every second, other server errors keep it
+    and every block signal (403/429/503 response, timeout or connection error, latency spike, empty or incomplete page
+    reported by the caller) multiplies it by decrease factor. Signals arriving within cooldown after a decrease are
+    ignored, so a burst of failures of concurrent requests counts once. Safe to use from any thread.
+    """
+
+    def __init__(self, initial_rate: float, min_rate: float = None, max_rate: float = None,
+                 increase: float = DEFAULT_RATE_INCREASE, decrease_factor: float = DEFAULT_RATE_DECREASE_FACTOR,
+                 latency_spike_factor: float = DEFAULT_LATENCY_SPIKE_FACTOR,
+                 decrease_cooldown: float = DEFAULT_DECREASE_COOLDOWN):
+        """
+        :param initial_rate: Requests per second of every host at start
+        :param min_rate: [Optional] Lowest rate, by default a tenth of initial rate
+        :param max_rate: [Optional] Highest rate, by default four times initial rate
+        :param increase: Rate increase in requests per second per second of healthy responses
+        :param decrease_factor: Factor applied to rate on block signal
+        :param latency_spike_factor: Response slower than this multiple of host's average latency is a block signal
+        :param decrease_cooldown: Min time in seconds between two decreases of host's rate
+        """
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate if min_rate is not None else initial_rate / 10
+        self.max_rate = max_rate if max_rate is not None else initial_rate * 4
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.blocks: Dict[str, int] = {}
+        self._rates: Dict[str, float] = {}
+        self._latencies: Dict[str, float] = {}
+        self._decreased_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def rate(self, host: str) -> float:
+        """
+        :param host: Host name (netloc)
+        :return: Current max number of requests per second sent to the host
+        """
+        return self._rates.get(host, self.initial_rate)
+
+    def on_response(self, host: str, status_code: int, latency: float):
+        """
+        Update host's rate after a response
+
+        :param host: Host name (netloc)
+        :param status_code: Response's status code
+        :param latency: Response's time in seconds
+        """
+        if status_code in BLOCK_STATUSES:
+            self.on_block(host, f'status {status_code}')
+            return
+        if status_code in RETRY_STATUSES:
+            # Overloaded server is not a reason to speed up
+            return
+
+        with self._lock:
+            average = self._latencies.get(host)
+            self._latencies[host] = latency if average is None else \
+                (1 - LATENCY_SMOOTHING) * average + LATENCY_SMOOTHING * latency
+            is_spike = average is not None and latency > self.latency_spike_factor * average
+            if not is_spike:
+                rate = self.rate(host)
+                self._rates[host] = min(self.max_rate, rate + self.increase / rate)
+
+        if is_spike:
+            self.on_block(host, f'latency {latency:.1f}s, average {average:.1f}s')
+
+    def on_block(self, host: str, reason: str):
+        """
+        Decrease host's rate after a block signal
+
+        :param host: Host name (netloc)
+        :param reason: Description of the signal, logged with the decrease
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.blocks[host] = self.blocks.get(host, 0) + 1
+            if now - self._decreased_at.get(host, -self.decrease_cooldown) < self.decrease_cooldown:
+                return
+            self._decreased_at[host] = now
+            rate = self.rate(host)
+            self._rates[host] = max(self.min_rate, rate * self.decrease_factor)
+
+        logging.warning(f'Possible block by {host} ({reason}), slowing down from {rate:.2f} to '
+                        f'{self._rates[host]:.2f} requests per second')
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests sent to the same host so that no host gets more than given number of requests per second.
+    With a controller the rate of every host is taken from it. Must be used only from the fetcher's event loop.
+    """
+
+    def __init__(self, requests_per_second: Optional[float], controller: Optional[AdaptiveRateController] = None):
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self.controller = controller
+        self._next_slot: Dict[str, float] = {}
+
+    async def wait(self, host: str):
+        """
+        Sleep until next free slot for given host
+
+        :param host: Host name (netloc) of requested URL
+        """
+        interval = 1 / self.controller.rate(host) if self.controller is not None else self.interval
+        if not interval:
+            return
+
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Fetcher:
+    """
+    Asyncio based fetch engine. Requests are scheduled on a background event loop which limits number of concurrent
+    requests and number of requests per second sent to a single host. Blocking calls are done on a thread pool, so
+    both coroutines (fetch) and sync callers (get, fetch_all, iter_fetch) can share the same limits.
+
+    All requests go through one keep-alive session with a bounded connection pool. Connection errors, timeouts and
+    429/5xx responses are retried with exponential backoff and full jitter. If cache is given, pages are served from it
+    and successfully fetched pages are stored in it. If revalidation store is given, ad pages are requested
+    conditionally and not requested at all if their summary in search results didn't change - NotModified is raised
+    for such pages.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+                 max_retries: int = DEFAULT_MAX_RETRIES, backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF, timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+                 cache: Optional[ResponseCache] = None, controller: Optional[AdaptiveRateController] = None,
+                 revalidation: Optional[RevalidationStore] = None):
+        """
+        :param max_concurrency: Max number of requests in flight (and size of the connection pool)
+        :param requests_per_second: [Optional] Max number of requests per second sent to a single host
+        :param max_retries: Max number of retries of a single request
+        :param backoff_factor: Base of exponential backoff in seconds
+        :param max_backoff: Upper limit of single backoff in seconds
+        :param timeout: Connect and read timeouts in seconds
+        :param cache: [Optional] Cache of page contents
+        :param controller: [Optional] Adaptive controller of per host rates, replaces fixed requests_per_second
+        :param revalidation: [Optional] Store with validators and summaries of already scraped ads
+        """
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.session = self._create_session(max_concurrency)
+        self.controller = controller
+        self.revalidation = revalidation
+        self._rate_limiter = HostRateLimiter(requests_per_second, controller)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='fetcher')
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='fetcher-loop', daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._create_semaphore(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _create_semaphore(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def fetch(self, url: str, use_cache: bool = True) -> str:
+        """
+        Fetch page content respecting concurrency and per host rate limits. Has to be awaited on fetcher's loop,
+        use submit to schedule it from other threads.
+
+        :param url: URL to call get request
+        :param use_cache: If False page is downloaded even if it is cached (and cache is updated)
+        :return: String with page content
+        """
+        loop = asyncio.get_event_loop()
+        headers = {}
+        if self.revalidation is not None and page_kind(url) == AD_PAGE:
+            if await loop.run_in_executor(None, self.revalidation.is_listing_unchanged, url):
+                NOT_MODIFIED.inc(reason=LISTING)
+                raise NotModified(url, LISTING)
+            headers = await loop.run_in_executor(None, self.revalidation.request_headers, url)
+
+        if self.cache is not None and use_cache:
+            content = await loop.run_in_executor(None, self.cache.get, url)
+            CACHE_REQUESTS.inc(result='miss' if content is None else 'hit')
+            if content is not None:
+                return content
+
+        async with self._semaphore:
+            await self._rate_limiter.wait(urlparse(url).netloc)
+            response = await loop.run_in_executor(self._executor, self._download, url, headers)
+
+        if response.status_code == NOT_MODIFIED_STATUS and headers:
+            NOT_MODIFIED.inc(reason=VALIDATORS)
+            raise NotModified(url, VALIDATORS)
+        if self.revalidation is not None and page_kind(url) == AD_PAGE and response.status_code == 200:
+            self.revalidation.fetched(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        if self.cache is not None and response.status_code == 200:
+            await loop.run_in_executor(None, self.cache.put, url, response.text)
+        return response.text
+
+    @staticmethod
+    def _create_session(pool_size: int) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+
+    def _download(self, url: str, headers: Dict[str, str] = None) -> requests.Response:
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, headers={'referer': url, **(headers or {})}, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                FETCH_ERRORS.inc()
+                BLOCK_SIGNALS.inc(kind='error')
+                if self.controller is not None:
+                    self.controller.on_block(urlparse(url).netloc, f'request failed: {type(e).__name__}')
+                if is_last:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f'Request to {url} failed ({e}), retrying in {delay:.1f}s')
+            else:
+                latency = time.monotonic() - started
+                FETCH_SECONDS.observe(latency)
+                RESPONSES.inc(status=response.status_code)
+                DOWNLOADED_BYTES.inc(len(response.content))
+                if response.status_code in BLOCK_STATUSES:
+                    BLOCK_SIGNALS.inc(kind='status')
+                if self.controller is not None:
+                    self.controller.on_response(urlparse(url).netloc, response.status_code, latency)
+                if response.status_code not in RETRY_STATUSES or is_last:
+                    return response
+                delay = self._backoff(attempt, response)
+                logging.warning(f'Request to {url} returned {response.status_code}, retrying in {delay:.1f}s')
+
+            time.sleep(delay)
+
+    def report_block(self, url: str, reason: str):
+        """
+        Report a block signal found in page content (ex. page without expected elements) to the rate controller.
+        The page is removed from cache, so retries and later runs download it again instead of replaying the block.
+
+        :param url: URL of the page
+        :param reason: Description of the signal
+        """
+        BLOCK_SIGNALS.inc(kind='content')
+        if self.cache is not None:
+            self.cache.delete(url)
+        if self.controller is not None:
+            self.controller.on_block(urlparse(url).netloc, reason)
+
+    def submit(self, url: str, use_cache: bool = True) -> Future:
+        """
+        Schedule fetch of given URL
+
+        :param url: URL to call get request
+        :param use_cache: If False page is downloaded even if it is cached
+        :return: Future with page content
+        """
+        return asyncio.run_coroutine_threadsafe(self.fetch(url, use_cache), self._ensure_loop())
+
+    def get(self, url: str, use_cache: bool = True) -> str:
+        """
+        Fetch single page and wait for the result
+
+        :param url: URL to call get request
+        :param use_cache: If False page is downloaded even if it is cached
+        :return: String with page content
+        """
+        return self.submit(url, use_cache).result()
+
+    @staticmethod
+    def _result(future: Future, return_exceptions: bool) -> Union[str, Exception]:
+        if not return_exceptions:
+            return future.result()
+        try:
+            return future.result()
+        except (requests.RequestException, NotModified) as e:
+            return e
+
+    def fetch_all(self, urls: Iterable[str], return_exceptions: bool = False) -> List[Union[str, Exception]]:
+        """
+        Fetch all pages concurrently
+
+        :param urls: URLs to call get requests
+        :param return_exceptions: If True request errors and NotModified are returned in place of content instead of
+        being raised
+        :return: List with pages content in the same order as urls
+        """
+        futures = [self.submit(url) for url in urls]
+        return [self._result(future, return_exceptions) for future in futures]
+
+    def iter_fetch(self, urls: Iterable[str], window: int = None,
+                   return_exceptions: bool = False) -> Iterator[Tuple[str, Union[str, Exception]]]:
+        """
+        Lazily fetch pages keeping at most window requests scheduled ahead of the consumer
+
+        :param urls: URLs to call get requests, consumed only as fast as results are consumed
+        :param window: [Optional] Max number of scheduled requests, by default twice the max concurrency
+        :param return_exceptions: If True request errors and NotModified are returned in place of content instead of
+        being raised
+        :return: Iterator of URL and page content pairs in the same order as urls
+        """
+        window = window or 2 * self.max_concurrency
+        pending: Deque[Tuple[str, Future]] = deque()
+
+        try:
+            for url in urls:
+                pending.append((url, self.submit(url)))
+                if len(pending) >= window:
+                    done_url, future = pending.popleft()
+                    yield done_url, self._result(future, return_exceptions)
+
+            while pending:
+                done_url, future = pending.popleft()
+                yield done_url, self._result(future, return_exceptions)
+        finally:
+            # Consumer stopped early, requests which were not started yet are dropped
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        """
+        Stop background event loop and thread pool
+        """
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+        self._executor.shutdown(wait=False)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.revalidation is not None:
+            self.revalidation.close()
+
+
+_fetcher: Optional[Fetcher] = None
+
+
+def configure_fetcher(**kwargs) -> Fetcher:
+    """
+    Replace shared fetcher with a new one created with given arguments
+
+    :param kwargs: Fetcher's arguments
+    :return: New shared fetcher
+    """
+    global _fetcher
+    if _fetcher is not None:
+        _fetcher.close()
+    _fetcher = Fetcher(**kwargs)
+    return _fetcher
+
+
+def get_fetcher() -> Fetcher:
+    """
+    :return: Shared fetcher, created with default limits on first use
+    """
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = Fetcher()
+    return _fetcher
+
+
+def get(url: str, use_cache: bool = True) -> str:
+    """
+    Fetch page with the shared fetcher
+
+    :param url: URL to call get request
+    :param use_cache: If False page is downloaded even if it is cached
+    :return: String with page content
+    """
+    return get_fetcher().get(url, use_cache)
@@ -0,0 +1,307 @@
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sinks import Sink
+
+DEFAULT_COMMIT_EVERY = 500
+DEFAULT_COMMIT_SECONDS = 5.0
+TECHNICAL_DATA = 'technical_data'
+FIELD_SEPARATOR = '.'
+
+
+class Version(NamedTuple):
+    ad_id: str
+    version: int
+    seen_at: float
+    price: Optional[int]
+
+
+class PriceChange(NamedTuple):
+    ad_id: str
+    seen_at: float
+    previous_price: Optional[int]
+    price: Optional[int]
+
+
+def content_hash(record: Dict) -> str:
+    """
+    :param record: Scraped ad
+    :return: Hash of ad's content, independent of keys order
+    """
+    return hashlib.sha1(json.dumps(record, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def parse_price(record: Dict) -> Optional[int]:
+    """
+    :param record: Scraped ad
+    :return: Price in Euro or None if ad has no price
+    """
+    digits = re.sub(r'\D', '', (record.get(TECHNICAL_DATA) or {}).get('price') or '')
+    return int(digits) if digits else None
+
+
+def _flatten(record: Dict) -> Dict[str, object]:
+    fields = {key: value for key, value in record.items() if key != TECHNICAL_DATA}
+    fields.update({
+        f'{TECHNICAL_DATA}{FIELD_SEPARATOR}{key}': value for key, value in (record.get(TECHNICAL_DATA) or {}).items()
+    })
+    return fields
+
+
+def _unflatten(fields: Dict[str, object]) -> Dict:
+    record = {TECHNICAL_DATA: {}}
+    for key, value in fields.items():
+        if key.startswith(TECHNICAL_DATA + FIELD_SEPARATOR):
+            record[TECHNICAL_DATA][key[len(TECHNICAL_DATA) + 1:]] = value
+        else:
+            record[key] = value
+    return record
+
+
+def _delta(previous: Dict[str, object], current: Dict[str, object]) -> Dict:
+    return {
+        'set': {key: value for key, value in current.items() if previous.get(key, object()) != value},
+        'removed': [key for key in previous if key not in current],
+    }
+
+
+class AdHistory(Sink):
+    """
+    Append-only history of scraped ads kept in SQLite and keyed by ad's id. Every record is hashed and a new version is
+    stored only when the hash differs from the latest version, as a delta of changed fields. Crawling unchanged ads only
+    moves their last seen time, so storage grows with changes and not with number of crawls. Can be used as a sink.
+    """
+
+    def __init__(self, path: str, commit_every: int = DEFAULT_COMMIT_EVERY,
+                 commit_seconds: float = DEFAULT_COMMIT_SECONDS):
+        """
+        :param path: Path to SQLite file with history, created if missing
+        :param commit_every: Max number of buffered ads, written together in a single short transaction
+        :param commit_seconds: Max time in seconds between the first buffered ad and its write
+        """
+        self.commit_every = commit_every
+        self.commit_seconds = commit_seconds
+        # Seen ads with timestamps, scraped record or None for ads seen without changes
+        self._pending: List[Tuple[str, float, Optional[Dict]]] = []
+        self._started_at: Optional[float] = None
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS ads ('
+            'id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, fields TEXT NOT NULL, price INTEGER, '
+            'version INTEGER NOT NULL, first_seen_at REAL NOT NULL, last_seen_at REAL NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS versions ('
+            'id TEXT NOT NULL, version INTEGER NOT NULL, seen_at REAL NOT NULL, content_hash TEXT NOT NULL, '
+            'delta TEXT NOT NULL, price INTEGER, previous_price INTEGER, PRIMARY KEY (id, version))'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS ads_last_seen_at ON ads (last_seen_at)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS versions_seen_at ON versions (seen_at)')
+
+    def write(self, record: Dict) -> List[str]:
+        return self.observe(record)
+
+    def unchanged(self, ad_id: str) -> List[str]:
+        return self.seen(ad_id)
+
+    def seen(self, ad_id: str, seen_at: float = None) -> List[str]:
+        """
+        Record that ad was seen without changes, ads unknown to the history are ignored
+
+        :param ad_id: Ad's id
+        :param seen_at: [Optional] Timestamp of crawl, now by default
+        :return: Ids of ads written by the call
+        """
+        return self._add(ad_id, seen_at, None)
+
+    def observe(self, record: Dict, seen_at: float = None) -> List[str]:
+        """
+        Record that ad was seen, its new version is stored only if its content changed
+
+        :param record: Scraped ad
+        :param seen_at: [Optional] Timestamp of scraping, now by default
+        :return: Ids of ads written by the call
+        """
+        return self._add(record['id'], seen_at, record)
+
+    def _add(self, ad_id: str, seen_at: Optional[float], record: Optional[Dict]) -> List[str]:
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self._pending.append((ad_id, seen_at if seen_at is not None else time.time(), record))
+        if len(self._pending) >= self.commit_every or time.monotonic() - self._started_at >= self.commit_seconds:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[str]:
+        """
+        Write buffered ads. Write lock is held only for the single transaction, so several processes can share the
+        history file.
+
+        :return: Ids of written ads
+        """
+        if not self._pending:
+            return []
+
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            for ad_id, seen_at, record in self._pending:
+                if record is None:
+                    self._connection.execute('UPDATE ads SET last_seen_at = ? WHERE id = ?', (seen_at, ad_id))
+                else:
+                    self._store(record, seen_at)
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+        ids = [ad_id for ad_id, _, _ in self._pending]
+        self._pending = []
+        self._started_at = None
+        return ids
+
+    def _store(self, record: Dict, seen_at: float) -> bool:
+        ad_id = record['id']
+        record_hash = content_hash(record)
+        row = self._connection.execute(
+            'SELECT content_hash, fields, price, version FROM ads WHERE id = ?', (ad_id,)
+        ).fetchone()
+        if row is not None and row[0] == record_hash:
+            self._connection.execute('UPDATE ads SET last_seen_at = ? WHERE id = ?', (seen_at, ad_id))
+            return False
+
+        fields = _flatten(record)
+        price = parse_price(record)
+        if row is None:
+            previous_fields, previous_price, version = {}, None, 1
+        else:
+            previous_fields, previous_price, version = json.loads(row[1]), row[2], row[3] + 1
+
+        self._connection.execute(
+            'INSERT INTO versions (id, version, seen_at, content_hash, delta, price, previous_price) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (ad_id, version, seen_at, record_hash, json.dumps(_delta(previous_fields, fields)), price, previous_price)
+        )
+        self._connection.execute(
+            'INSERT INTO ads (id, content_hash, fields, price, version, first_seen_at, last_seen_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET content_hash = excluded.content_hash, '
+            'fields = excluded.fields, price = excluded.price, version = excluded.version, '
+            'last_seen_at = excluded.last_seen_at',
+            (ad_id, record_hash, json.dumps(fields), price, version, seen_at, seen_at)
+        )
+        return True
+
+    def versions(self, ad_id: str) -> List[Version]:
+        """
+        :param ad_id: Ad's id
+        :return: Stored versions of the ad, oldest first
+        """
+        rows = self._connection.execute(
+            'SELECT id, version, seen_at, price FROM versions WHERE id = ? ORDER BY version', (ad_id,)
+        )
+        return [Version(*row) for row in rows]
+
+    def record(self, ad_id: str, version: int = None) -> Optional[Dict]:
+        """
+        :param ad_id: Ad's id
+        :param version: [Optional] Version of the ad, the latest by default
+        :return: Ad as it was scraped in given version or None if ad (or version) is unknown
+        """
+        if version is None:
+            row = self._connection.execute('SELECT fields FROM ads WHERE id = ?', (ad_id,)).fetchone()
+            return _unflatten(json.loads(row[0])) if row is not None else None
+
+        fields = {}
+        rows = self._connection.execute(
+            'SELECT delta FROM versions WHERE id = ? AND version <= ? ORDER BY version', (ad_id, version)
+        ).fetchall()
+        for delta, in rows:
+            delta = json.loads(delta)
+            fields.update(delta['set'])
+            for key in delta['removed']:
+                fields.pop(key, None)
+        return _unflatten(fields) if len(rows) == version else None
+
+    def price_history(self, ad_id: str) -> List[Tuple[float, Optional[int]]]:
+        """
+        :param ad_id: Ad's id
+        :return: Pairs of timestamp since which the price was valid and price, oldest first
+        """
+        rows = self._connection.execute(
+            'SELECT seen_at, price FROM versions WHERE id = ? AND (version = 1 OR price IS NOT previous_price) '
+            'ORDER BY version', (ad_id,)
+        )
+        return rows.fetchall()
+
+    def price_changes(self, since: float) -> List[PriceChange]:
+        """
+        :param since: Timestamp
+        :return: Price changes of all ads seen since given time, oldest first
+        """
+        rows = self._connection.execute(
+            'SELECT id, seen_at, previous_price, price FROM versions '
+            'WHERE seen_at >= ? AND version > 1 AND price IS NOT previous_price ORDER BY seen_at', (since,)
+        )
+        return [PriceChange(*row) for row in rows]
+
+    def disappeared(self, not_seen_since: float) -> Iterator[Tuple[str, float]]:
+        """
+        :param not_seen_since: Timestamp, usually start of the last complete crawl
+        :return: Iterator of ids of ads not seen since given time and their last seen timestamp, most recent first
+        """
+        yield from self._connection.execute(
+            'SELECT id, last_seen_at FROM ads WHERE last_seen_at < ? ORDER BY last_seen_at DESC', (not_seen_since,)
+        )
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query history of scraped car ads')
+    parser.add_argument(
+        'path',
+        help="Path to SQLite file with history",
+        type=str
+    )
+    parser.add_argument(
+        '--prices',
+        help="Print price history of ad with given id",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--price-changes',
+        help="Print price changes of the last given number of hours",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--disappeared',
+        help="Print ads not seen for given number of hours",
+        type=float,
+        default=None
+    )
+    args = parser.parse_args()
+
+    history = AdHistory(args.path)
+    now = time.time()
+    if args.prices:
+        for seen_at, price in history.price_history(args.prices):
+            print(f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(seen_at))}\t{price}')
+    if args.price_changes is not None:
+        for change in history.price_changes(now - args.price_changes * 3600):
+            print(f'{change.ad_id}\t{change.previous_price} -> {change.price}')
+    if args.disappeared is not None:
+        for ad_id, last_seen_at in history.disappeared(now - args.disappeared * 3600):
+            print(f'{ad_id}\t{time.strftime("%Y-%m-%d %H:%M", time.localtime(last_seen_at))}')
+    history.close()
+
+
+if __name__ == '__main__':
+    main()
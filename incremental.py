@@ -0,0 +1,59 @@
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from cache import normalize_url
+
+NEWEST_IDS_LIMIT = 100
+
+
+class SearchStateStore:
+    """
+    Remembers the newest ads seen under every search, so that searches sorted by creation time can be paginated only
+    until already known ads are reached. State is kept in a JSON file keyed by normalized search URL.
+    """
+
+    def __init__(self, path: str, newest_ids_limit: int = NEWEST_IDS_LIMIT):
+        """
+        :param path: Path to JSON file with state, created on first save
+        :param newest_ids_limit: Number of newest ad's ids remembered per search
+        """
+        self.path = path
+        self.newest_ids_limit = newest_ids_limit
+        self._state: Dict[str, Dict] = {}
+
+        if os.path.exists(path):
+            with open(path) as file:
+                self._state = json.load(file)
+
+    def newest_ids(self, search_url: str) -> List[str]:
+        """
+        :param search_url: URL to page with search results (without page selection)
+        :return: Ids of the newest ads seen under the search, newest first, empty if search was never crawled
+        """
+        return self._state.get(normalize_url(search_url), {}).get('newest_ids', [])
+
+    def last_crawled_at(self, search_url: str) -> Optional[float]:
+        """
+        :param search_url: URL to page with search results (without page selection)
+        :return: Timestamp of the last crawl of the search or None if search was never crawled
+        """
+        return self._state.get(normalize_url(search_url), {}).get('crawled_at')
+
+    def update(self, search_url: str, new_ids: Iterable[str]):
+        """
+        Put ids of ads found during the last crawl in front of remembered ones and save the state
+
+        :param search_url: URL to page with search results (without page selection)
+        :param new_ids: Ids of ads found during the last crawl, newest first
+        """
+        newest_ids = list(dict.fromkeys([*new_ids, *self.newest_ids(search_url)]))[:self.newest_ids_limit]
+        self._state[normalize_url(search_url)] = {'newest_ids': newest_ids, 'crawled_at': time.time()}
+        self._save()
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self._state, file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,110 @@
+import json
+import logging
+from typing import Dict, Iterator, List, NamedTuple, Set
+
+from catalog import CATALOG
+from search_filter import SearchFilter, SellerType, Country
+from url_creator import URLCreator
+
+FILTER_KEYS = (
+    'min_price', 'max_price', 'base_url', 'seller_type', 'country', 'min_horse_power', 'max_horse_power',
+    'max_first_registration', 'min_first_registration', 'min_mileage', 'max_mileage'
+)
+JOB_KEYS = ('name', 'car_brand', 'car_type', 'expand_models', *FILTER_KEYS)
+
+
+class Job(NamedTuple):
+    """
+    Single search of a batch run
+    """
+    name: str
+    search: SearchFilter
+
+
+def _create_jobs(spec: Dict, defaults: Dict) -> List[Job]:
+    spec = {**defaults, **spec}
+    unknown = set(spec) - set(JOB_KEYS)
+    if unknown:
+        raise ValueError(f'Unknown job keys: {", ".join(sorted(unknown))}')
+    if 'car_brand' not in spec:
+        raise ValueError(f'Job {spec} has no car_brand')
+
+    filters = {key: spec.get(key) for key in FILTER_KEYS}
+    filters['base_url'] = filters['base_url'] or URLCreator.DEFAULT_URL
+    filters['seller_type'] = SellerType.parse(filters['seller_type'])
+    filters['country'] = Country.parse(filters['country'])
+
+    if spec.get('expand_models'):
+        models = CATALOG.expand(spec['car_brand'], spec.get('car_type'))
+    else:
+        models = CATALOG.find(spec['car_brand'], spec.get('car_type')),
+
+    name = spec.get('name') or ' '.join(str(spec[key]) for key in ('car_brand', 'car_type') if spec.get(key))
+    return [
+        Job(
+            f'{name}/{model.name}' if len(models) > 1 else name,
+            SearchFilter(**filters, car_brand=model.brand_code, car_type=model.code)
+        )
+        for model in models
+    ]
+
+
+def load_jobs(path: str) -> List[Job]:
+    """
+    Load jobs from YAML (requires PyYAML) or JSON file. File contains list of jobs under "jobs" key and optional
+    "defaults" applied to every job. Job has car_brand, optional car_type and name, filters named like main's
+    arguments (min_price, seller_type, ...) and optional expand_models flag, which splits the job into one job per
+    model of the brand or series.
+
+    :param path: Path to job file
+    :return: Jobs in order of the file
+    """
+    with open(path) as file:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('YAML job files require PyYAML, install it with: pip install pyyaml')
+            content = yaml.safe_load(file)
+        else:
+            content = json.load(file)
+
+    if isinstance(content, list):
+        content = {'jobs': content}
+    defaults = content.get('defaults') or {}
+    return [job for spec in content.get('jobs') or [] for job in _create_jobs(spec, defaults)]
+
+
+class JobPlanner:
+    """
+    Plans search pages of many jobs. Jobs usually overlap (ex. a series and one of its models), so searches already
+    planned for previous jobs are skipped.
+    """
+
+    def __init__(self, url_creator: URLCreator = None):
+        """
+        :param url_creator: [Optional] Creator of search pages, new one by default
+        """
+        self.url_creator = url_creator if url_creator is not None else URLCreator()
+        self._planned: Set[SearchFilter] = set()
+
+    def search_pages(self, job: Job) -> List[str]:
+        """
+        :param job: Job to plan
+        :return: URLs to job's pages with search results (without page selection) not planned before
+        """
+        pages = []
+        for search in self.url_creator.plan_searches(job.search):
+            if search not in self._planned:
+                self._planned.add(search)
+                pages.append(search.url)
+
+        logging.info(f'Job {job.name}: {len(pages)} search pages')
+        return pages
+
+    def plan(self, jobs: List[Job]) -> Iterator[List[str]]:
+        """
+        :param jobs: Jobs to plan
+        :return: Iterator of search pages of every job, job is planned only when its pages are requested
+        """
+        return (self.search_pages(job) for job in jobs)
@@ -1,54 +1,76 @@
 import argparse
+import cProfile
 import json
 import logging
-from typing import List, Dict, Tuple, Optional
-
-import requests
-from bs4 import BeautifulSoup, Tag
-
-from consts import CAR_BRANDS, BRAND_CODE, BRAND_TYPES
-from url_creator import URLCreator, Country
-
-
-def get(url: str) -> str:
+import os
+import time
+from collections import deque
+from functools import partial
+from itertools import chain
+from typing import List, Dict, Optional, Iterable, Iterator, Container, Union, Deque, Tuple, NamedTuple, Callable
+
+from ad_index import AdIndex, extract_ad_id
+from cache import ResponseCache, DEFAULT_SEARCH_TTL, DEFAULT_AD_TTL, DEFAULT_MAX_SIZE
+from catalog import CATALOG
+from counts import configure_count_probe, DEFAULT_COUNT_TTL, COUNTS_FILE_NAME
+from fetcher import get, get_fetcher, configure_fetcher, AdaptiveRateController, NotModified, \
+    DEFAULT_MAX_CONCURRENCY, DEFAULT_REQUESTS_PER_SECOND, DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT
+from history import AdHistory
+from incremental import SearchStateStore
+from jobs import Job, JobPlanner, load_jobs
+from metrics import Progress, SnapshotWriter, serve_metrics, BUFFERED_URLS, NOT_MODIFIED, PARSE_SECONDS, \
+    QUEUE_TASKS, SEARCH_PAGES, DEFAULT_SNAPSHOT_INTERVAL, SCRAPED, UNCHANGED, FAILED
+from parsers import get_parser, configure_parser, get_parser_pool, configure_parser_pool, BS4, LXML
+# Extraction helpers moved to parsers, re-exported for code importing them from main
+from parsers import extract_single_value, extract_technical_data, extract_rbt_features
+from pipeline import buffered, round_robin, DEFAULT_BUFFER_SIZE, DEFAULT_MAX_ACTIVE
+from revalidation import RevalidationStore, Unchanged, page_hash, CONTENT, LISTING, DEFAULT_MAX_AGE
+from search_filter import SearchFilter, SellerType, Country
+from url_creator import URLCreator
+from sinks import Sink, JsonFileSink, TeeSink, create_sink, JSON, JSONL, PARQUET, DEFAULT_MAX_RECORDS, \
+    DEFAULT_MAX_SECONDS
+from work_queue import WorkQueue, Task, SEARCH_TASK, AD_TASK, DEFAULT_MAX_ATTEMPTS, \
+    DEFAULT_LEASE_TIMEOUT, PENDING, IN_FLIGHT
+
+__all__ = [
+    'get_ads_urls', 'parse_ads_urls', 'extract_max_page_number', 'parse_max_page_number', 'search_urls',
+    'search_new_ads_urls', 'save_scraped_results', 'scrape_car', 'scrape_cars', 'AdSaver', 'parse_car',
+    'extract_unique_ads', 'main', 'crawl', 'crawl_jobs', 'save_ads', 'crawl_incremental', 'update_search_state',
+    'crawl_with_queue', 'process_search_task', 'process_ad_tasks',
+    'extract_single_value', 'extract_technical_data', 'extract_rbt_features',
+]
+
+MAX_PAGES = 50
+QUEUE_POLL_INTERVAL = 10
+
+
+def get_ads_urls(url: str) -> Iterator[str]:
     """
-    Call requests get method with given URL and hardcoded headers
+    Extracts URLs to car's ads from search page
 
-    :param url: URL to call get request
-    :return: String with page content
+    :param url: URL to page with search results
+    :return: Iterator of extracted urls
     """
-    response = requests.get(
-        url,
-        headers={
-            'authority': 'suchen.mobile.de',
-            'scheme': 'https',
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-            'accept-encoding': 'gzip, deflate, br',
-            'accept-language': 'en-GB,en-US;q=0.9,en;q=0.8',
-            'cache-control': 'max-age=0',
-            'referer': url,
-            'sec-fetch-dest': 'document',
-            'sec-fetch-mode': 'navigate',
-            'sec-fetch-site': 'same-origin',
-            'sec-fetch-user': '?1',
-            'upgrade-insecure-requests': '1',
-            'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/84.0.4147.135 Safari/537.36'
-        }
-    )
-    return response.text
+    yield from parse_ads_urls(get(url))
 
 
-def get_ads_urls(url: str) -> List[str]:
+def parse_ads_urls(content: str) -> List[str]:
     """
-    Extracts URLs to car's ads from search page
+    Extracts URLs to car's ads from search page content
 
-    :param url: URL to page with search results
+    :param content: Content of page with search results
     :return: List of extracted urls
     """
-    content = get(url)
-    soup = BeautifulSoup(content, features="html.parser")
-    results = soup.findAll('a', class_="link--muted no--text--decoration result-item")
-    return [ad_url.attrs['href'] for ad_url in results if 'suchen.mobile.de' in ad_url.attrs['href']]
+    SEARCH_PAGES.inc()
+    revalidation = get_fetcher().revalidation
+    if revalidation is None:
+        return get_parser().parse_ads_urls(content)
+
+    # Ad's data shown in search results is remembered, so ads with unchanged summary don't have to be fetched
+    summaries = get_parser().parse_ads_summaries(content)
+    for url, summary in summaries:
+        revalidation.list(url, summary)
+    return [url for url, _ in summaries]
 
 
 def extract_max_page_number(url: str) -> int:
@@ -58,131 +80,249 @@ def extract_max_page_number(url: str) -> int:
     :param url: URL to main page with search's results
     :return:
     """
-    content = get(url)
-    soup = BeautifulSoup(content, features="html.parser")
-    tmp = soup.find_all('span', {'class': 'btn btn--muted btn--s'})
-    values = [int(value.text) for value in tmp]
-    if values:
-        return max(values)
-    return 1
+    return parse_max_page_number(get(url))
 
 
-def search_urls(url: str) -> List[str]:
+def parse_max_page_number(content: str) -> int:
     """
-    Iterate across pages with search results and extract ad's urls
+    Extract number of pages with search results from page content
 
-    :param url: URL to page with search results (without page selection)
-    :return: List of URLs to car's ads
+    :param content: Content of page with search results
+    :return: Number of pages
     """
-    urls = []
-    n = extract_max_page_number(url)
+    return get_parser().parse_max_page_number(content)
 
-    for page_n in range(1, n+1):
-        page_url = url + f'&pageNumber={page_n}'
-        tmp_urls = get_ads_urls(page_url)
-
-        if len(tmp_urls) == 0:
-            logging.warning(f'No URLs found under {page_url}. You may be blocked!')
-
-        urls += tmp_urls
-
-    return urls
 
-
-def extract_single_value(features_tag: Tag) -> Tuple[str, str]:
+def search_urls(url: str, raise_errors: bool = False) -> Iterator[str]:
     """
-    Extract single value from structured form of tag (like technical features)
+    Iterate across pages with search results and extract ad's urls. The first page provides both the number of pages
+    and its ads, the remaining pages are then requested at once and ad's urls are yielded as soon as their page is
+    parsed. If a page comes back empty or fails, which usually means throttling, concurrent pagination is stopped and
+    the remaining pages are fetched one by one. If the first page fails, the search is skipped.
 
-    :param features_tag: Tag with structured form of data
-    :return: Tuple of name and value
+    :param url: URL to page with search results (without page selection)
+    :param raise_errors: [Optional] Raise error of the first page instead of skipping the search, ex. to retry it later
+    :return: Iterator of URLs to car's ads
     """
-    res = features_tag.find_all('div', class_='g-col-6')
-    name = res[0].text
-    value = res[1].text
-    return name, value
-
-
-def extract_technical_data(technical_data: Tag) -> Dict[str, str]:
+    try:
+        first_page = get(url)
+    except Exception as e:
+        if raise_errors:
+            raise
+        logging.warning(f'Failed to fetch {url}, skipping the search: {e}')
+        get_fetcher().report_block(url, 'search page failed')
+        return
+    n = parse_max_page_number(first_page)
+    yield from _page_ads_urls(url, first_page)
+
+    pages_urls = [url + f'&pageNumber={page_n}' for page_n in range(2, n+1)]
+    fetched = 0
+    for page_url, content in get_fetcher().iter_fetch(pages_urls, window=len(pages_urls), return_exceptions=True):
+        tmp_urls = parse_ads_urls(content) if not isinstance(content, Exception) else []
+        if not tmp_urls:
+            logging.info(f'No URLs found under {page_url}, fetching remaining pages sequentially')
+            get_fetcher().report_block(page_url, 'search page without ads')
+            break
+        fetched += 1
+        yield from tmp_urls
+
+    for page_n, page_url in enumerate(pages_urls[fetched:]):
+        try:
+            # Page which came back empty is downloaded again, not replayed from cache
+            content = get(page_url, use_cache=page_n > 0)
+        except Exception as e:
+            logging.warning(f'Failed to fetch {page_url}: {e}')
+            continue
+        yield from _page_ads_urls(page_url, content)
+
+
+def _page_ads_urls(page_url: str, content: str) -> List[str]:
+    tmp_urls = parse_ads_urls(content)
+    if len(tmp_urls) == 0:
+        logging.warning(f'No URLs found under {page_url}. You may be blocked!')
+        get_fetcher().report_block(page_url, 'search page without ads')
+    return tmp_urls
+
+
+def search_new_ads_urls(url: str, known_ids: Container[str]) -> Iterator[str]:
     """
-    Extract car's technical data (common structure across different ads)
+    Iterate across pages with search results sorted from the newest ads and extract ad's urls until already known ad
+    is reached. Pages are fetched one by one, so pagination stops right after the first page with a known ad.
 
-    :param technical_data: Tag with div g-col-6 vip-price-rating__tech-details class
-    :return: Dict with technical data key words and values
+    :param url: URL to page with search results sorted by creation time (without page selection)
+    :param known_ids: Ids of ads found under the search before
+    :return: Iterator of URLs to ads newer than known ones, newest first
     """
-    results = {}
-    price_results = technical_data.find_all('div', class_='g-col-6 vip-price-rating__tech-details')
+    for page_n in range(1, MAX_PAGES + 1):
+        page_url = url + f'&pageNumber={page_n}'
+        tmp_urls = parse_ads_urls(get(page_url))
 
-    if len(price_results) == 1:
-        price = technical_data \
-            .find_all('div', class_='g-col-6 vip-price-rating__tech-details')[0] \
-            .text.split('€')[0] \
-            .rstrip()
-        results['price'] = price
+        if len(tmp_urls) == 0:
+            if page_n == 1:
+                logging.warning(f'No URLs found under {page_url}. You may be blocked!')
+            return
 
-    else:
-        logging.warning('Price was not identified')
+        for ad_url in tmp_urls:
+            if extract_ad_id(ad_url) in known_ids:
+                return
+            yield ad_url
 
-    rest_info = technical_data.find_all('div', class_='g-row u-margin-bottom-9')
-    for tag in rest_info:
-        name, value = extract_single_value(tag)
-        results[name] = value
+    logging.warning(f'No known ads found within {MAX_PAGES} pages of {url}, older new ads may be missed')
 
-    return results
 
+def save_scraped_results(results):
+    JsonFileSink().write(results)
 
-def extract_rbt_features(rbt_features: Tag) -> List[str]:
-    """
-    Extract rbt features from provided tag
 
-    :param rbt_features: Tag with div g-col-6 class
-    :return: List of car's features
+def scrape_car(url: str) -> Optional[Dict]:
     """
-    results = []
-    for tag in rbt_features.find_all('div', {'class': 'g-col-6'}):
-        results.append(tag.text)
+    Scrape info about car from provided url
 
-    return results
+    :param url: URL with mobile.de ad
+    :return: Dict with scraped ad or None if ad couldn't be scraped
+    """
+    return parse_car(url, get(url))
 
 
-def save_scraped_results(results):
-    with open(f'ad_{results["id"]}.json', 'w+') as file:
-        json.dump(results, file)
+class _FetchedAd(NamedTuple):
+    url: str
+    is_fetched: bool
+    content_hash: Optional[str]
+    # How ad was found unchanged, None if it has to be parsed
+    unchanged: Optional[str]
 
 
-def scrape_car(url: str) -> Optional[Dict]:
+def scrape_cars(urls: Iterable[str]) -> Iterator[Union[Dict, Unchanged, None]]:
     """
-    Scrape info about car from provided url
+    Scrape info about cars from provided urls, ads are fetched concurrently and parsed in parser pool if it is
+    configured. If fetcher has a revalidation store, ads which didn't change since they were scraped last time are
+    neither parsed nor (if their summary in search results or validators show it) downloaded.
 
-    :param url: URL with mobile.de ad
-    :return: Bool if ad was successfully scraped
+    :param urls: URLs with mobile.de ads
+    :return: Iterator of scraped ads (Unchanged if ad didn't change, None if ad couldn't be scraped) in the same order
+    as urls
+    """
+    fetcher = get_fetcher()
+    revalidation = fetcher.revalidation
+    fetched: Deque[_FetchedAd] = deque()
+
+    def pages() -> Iterator[Tuple[str, Optional[str]]]:
+        for url, content in fetcher.iter_fetch(urls, return_exceptions=True):
+            if isinstance(content, NotModified):
+                fetched.append(_FetchedAd(url, True, None, content.reason))
+                yield url, None
+                continue
+
+            content = _content_or_none(url, content)
+            content_hash = page_hash(content) if revalidation is not None and content is not None else None
+            if content_hash is not None and revalidation.is_content_unchanged(url, content_hash):
+                NOT_MODIFIED.inc(reason=CONTENT)
+                fetched.append(_FetchedAd(url, True, content_hash, CONTENT))
+                yield url, None
+                continue
+
+            fetched.append(_FetchedAd(url, content is not None, content_hash, None))
+            yield url, content
+
+    parser_pool = get_parser_pool()
+    if parser_pool is None:
+        scraped_ads = (parse_car(url, content) if content is not None else None for url, content in pages())
+    else:
+        scraped_ads = parser_pool.parse_cars(pages())
+
+    for scraped_ad in scraped_ads:
+        ad = fetched.popleft()
+        if ad.unchanged is not None:
+            # Summary in search results is not verified, so it doesn't extend state's max age
+            if ad.unchanged != LISTING:
+                revalidation.verified(ad.url)
+            yield Unchanged(extract_ad_id(ad.url))
+            continue
+
+        if scraped_ad is None and ad.is_fetched:
+            fetcher.report_block(ad.url, 'ad page without title or data')
+        if revalidation is not None:
+            if scraped_ad is None:
+                revalidation.discard(ad.url)
+            else:
+                revalidation.parsed(ad.url, ad.content_hash)
+        yield scraped_ad
+
+
+class AdSaver:
+    """
+    Writes scraped ads to the sink. Sink may buffer ads, so ad is added to the index, its revalidation state is saved
+    (and its callback is called) only once the sink wrote it, ads which are lost on a crash are scraped again by the
+    next run.
     """
-    content = get(url)
-    soup = BeautifulSoup(content, features="html.parser")
-    technical_data = soup.find('div', class_='cBox-body cBox-body--technical-data')
-    rbt_features = soup.find('div', {"id": "rbt-features"})
 
-    if not technical_data and not rbt_features:
+    def __init__(self, ad_index: AdIndex, sink: Sink):
+        """
+        :param ad_index: Index of already scraped ads
+        :param sink: Destination of scraped ads
+        """
+        self.ad_index = ad_index
+        self.sink = sink
+        self.revalidation = get_fetcher().revalidation
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+
+    def save(self, scraped_ad: Union[Dict, Unchanged, None], on_written: Callable[[], None] = None) -> str:
+        """
+        :param scraped_ad: Result of scrape_cars
+        :param on_written: [Optional] Function called once the ad is written
+        :return: Result of processing the ad - SCRAPED, UNCHANGED or FAILED
+        """
+        if isinstance(scraped_ad, Unchanged):
+            ad_id, result = scraped_ad.id, UNCHANGED
+        elif scraped_ad:
+            ad_id, result = scraped_ad['id'], SCRAPED
+        else:
+            return FAILED
+
+        if on_written is not None:
+            self._callbacks.setdefault(ad_id, []).append(on_written)
+        self._written(self.sink.unchanged(ad_id) if result == UNCHANGED else self.sink.write(scraped_ad))
+        return result
+
+    def is_pending(self, ad_id: str) -> bool:
+        """
+        :param ad_id: Ad's id
+        :return: True if ad is saved, but waits in sink's buffer
+        """
+        return ad_id in self._callbacks
+
+    def flush(self):
+        """
+        Write ads buffered by the sink
+        """
+        self._written(self.sink.flush())
+
+    def _written(self, ids: List[str]):
+        for ad_id in ids:
+            self.ad_index.add(ad_id)
+            if self.revalidation is not None:
+                self.revalidation.scraped(ad_id)
+            for callback in self._callbacks.pop(ad_id, []):
+                callback()
+
+
+def _content_or_none(url: str, content: Union[str, Exception]) -> Optional[str]:
+    if isinstance(content, Exception):
+        logging.warning(f'Failed to fetch {url}: {content}')
         return None
+    return content
 
-    ad_title = soup.find('h1', {'id': 'rbt-ad-title'}).text
-
-    loc = soup.find('p', {'id': 'rbt-seller-address'}).text
 
-    if technical_data:
-        technical_data = extract_technical_data(technical_data)
-
-    if rbt_features:
-        rbt_features = extract_rbt_features(rbt_features)
+def parse_car(url: str, content: str) -> Optional[Dict]:
+    """
+    Extract info about car from ad's page content
 
-    ad_id = url.split('id=')[1].split('&')[0]
-    results = {
-        'id': ad_id,
-        'title': ad_title,
-        'rbt_features': rbt_features,
-        'technical_data': technical_data,
-        'loc': loc
-    }
-    return results
+    :param url: URL with mobile.de ad
+    :param content: Content of ad's page
+    :return: Dict with scraped ad or None if ad couldn't be scraped
+    """
+    with PARSE_SECONDS.time():
+        return get_parser().parse_car(url, content)
 
 
 def extract_unique_ads(urls: List[str]) -> List[str]:
@@ -190,46 +330,50 @@ def extract_unique_ads(urls: List[str]) -> List[str]:
     Extract unique urls (sometimes duplicated ad's urls can be attached)
 
     :param urls: List of scraped ad's links
-    :return: List of unique ad's links
+    :return: List of unique ad's links, in order of first occurrence
     """
-    ids = set([url.split('id=')[1].split('&')[0] for url in urls])
-
-    results = []
-    for ad_id in ids:
-        results.append(list(filter(lambda url: ad_id in url, urls))[0])
-
-    return results
+    return list(AdIndex().unique(urls))
 
 
 def main():
     parser = argparse.ArgumentParser(description='Scrape car ads from mobile.de service')
     parser.add_argument(
         '--car-brand',
-        help="Lowercase car's brand name ex. audi, opel",
-        type=str,
-        required=True
+        help="Car's brand name ex. audi, opel. Required unless --jobs is given",
+        type=str
     )
     parser.add_argument(
         '--car-type',
-        help="Lowercase car's brand name ex. a1, astra",
+        help="Car's model or series name ex. a1, astra, series 3. All models of the brand if not given",
         type=str,
-        required=True
+        default=None
     )
     parser.add_argument(
         '--seller-type',
-        help="Type of seller - private/seller/company",
-        type=str
+        help="Type of seller - private/dealer/company",
+        type=SellerType.parse
     )
     parser.add_argument(
         '--base-url',
         help="Base search URL to which code will add expected filters",
-        type=str
+        type=str,
+        default=URLCreator.DEFAULT_URL
+    )
+    parser.add_argument(
+        '--country',
+        help="Country code of the ads ex. DE",
+        type=Country.parse
     )
     parser.add_argument(
         '--min-price',
         help="Min price in Euro",
         type=int
     )
+    parser.add_argument(
+        '--max-price',
+        help="Max price in Euro, by default there is no upper limit",
+        type=int
+    )
     parser.add_argument(
         '--min-horse-power',
         help="Min horse power",
@@ -260,11 +404,282 @@ def main():
         help="Max mileage in km",
         type=int
     )
+    parser.add_argument(
+        '--max-concurrency',
+        help="Max number of concurrent requests",
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY
+    )
+    parser.add_argument(
+        '--requests-per-second',
+        help="Max number of requests per second sent to mobile.de",
+        type=float,
+        default=DEFAULT_REQUESTS_PER_SECOND
+    )
+    parser.add_argument(
+        '--max-retries',
+        help="Max number of retries of a failed request",
+        type=int,
+        default=DEFAULT_MAX_RETRIES
+    )
+    parser.add_argument(
+        '--timeout',
+        help="Read timeout of a single request in seconds",
+        type=float,
+        default=DEFAULT_TIMEOUT[1]
+    )
+    parser.add_argument(
+        '--adaptive-rate',
+        help="Adapt request rate to mobile.de's responses: start at --requests-per-second, speed up while responses "
+             "are healthy and slow down on signs of blocking",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--min-requests-per-second',
+        help="Lowest request rate of --adaptive-rate, by default a tenth of --requests-per-second",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--max-requests-per-second',
+        help="Highest request rate of --adaptive-rate, by default four times --requests-per-second",
+        type=float,
+        default=None
+    )
+    parser.add_argument(
+        '--cache-dir',
+        help="Directory with cache of fetched pages, pages are not cached if not set",
+        type=str
+    )
+    parser.add_argument(
+        '--search-ttl',
+        help="Time to live of cached search pages in seconds",
+        type=float,
+        default=DEFAULT_SEARCH_TTL
+    )
+    parser.add_argument(
+        '--ad-ttl',
+        help="Time to live of cached ad pages in seconds",
+        type=float,
+        default=DEFAULT_AD_TTL
+    )
+    parser.add_argument(
+        '--count-ttl',
+        help="Time to live of memoized numbers of search results in seconds, they are persisted in cache directory",
+        type=float,
+        default=DEFAULT_COUNT_TTL
+    )
+    parser.add_argument(
+        '--cache-size',
+        help="Max size of cache in MB",
+        type=int,
+        default=DEFAULT_MAX_SIZE // 1024 ** 2
+    )
+    parser.add_argument(
+        '--queue-path',
+        help="Path to SQLite file with durable crawl queue, progress is kept only in memory if not set",
+        type=str
+    )
+    parser.add_argument(
+        '--resume',
+        help="Continue crawl from the queue instead of starting over, several workers may resume the same queue",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--max-attempts',
+        help="Max number of attempts of a single search page or ad",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS
+    )
+    parser.add_argument(
+        '--lease-timeout',
+        help="Time in seconds after which search page or ad claimed by a worker which didn't finish it is claimed "
+             "again. Tasks of dead workers of the same host are released right away on --resume",
+        type=float,
+        default=DEFAULT_LEASE_TIMEOUT
+    )
+    parser.add_argument(
+        '--buffer-size',
+        help="Max number of discovered ads waiting to be scraped",
+        type=int,
+        default=DEFAULT_BUFFER_SIZE
+    )
+    parser.add_argument(
+        '--seen-ads',
+        help="Path to file with ids of already scraped ads, which are skipped and to which new ids are appended",
+        type=str
+    )
+    parser.add_argument(
+        '--history',
+        help="Path to SQLite file with history of scraped ads: new versions are stored only when ad's content "
+             "changed, which tracks price changes and disappeared ads. Should not be combined with --seen-ads, "
+             "which skips already known ads",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--revalidate',
+        help="Path to SQLite file with validators, content hashes and search result summaries of scraped ads. On a "
+             "recrawl ads with unchanged summary are not fetched, others are fetched with conditional requests and "
+             "not parsed if unchanged. Unchanged ads are not written again",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--revalidate-max-age',
+        help="Time in hours after which ads are fetched and parsed again even if they seem unchanged",
+        type=float,
+        default=DEFAULT_MAX_AGE / 3600
+    )
+    parser.add_argument(
+        '--incremental',
+        help="Path to file with state of searches. Searches crawled before are paginated only until already known "
+             "ads are reached, the first crawl is a full one",
+        type=str
+    )
+    parser.add_argument(
+        '--parser',
+        help="HTML parser backend, lxml is much faster, bs4 is used if lxml is not installed",
+        choices=[LXML, BS4],
+        default=LXML
+    )
+    parser.add_argument(
+        '--parser-workers',
+        help="Number of processes parsing ad pages, 0 parses them in the fetching process",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        '--output-format',
+        help="Format of scraped ads: json file per ad, or jsonl / parquet part files",
+        choices=[JSON, JSONL, PARQUET],
+        default=JSON
+    )
+    parser.add_argument(
+        '--output-dir',
+        help="Directory with scraped ads",
+        type=str,
+        default='.'
+    )
+    parser.add_argument(
+        '--part-size',
+        help="Max number of ads in a single jsonl / parquet part file",
+        type=int,
+        default=DEFAULT_MAX_RECORDS
+    )
+    parser.add_argument(
+        '--part-seconds',
+        help="Max time in seconds before buffered ads are written as a jsonl / parquet part file",
+        type=float,
+        default=DEFAULT_MAX_SECONDS
+    )
+    parser.add_argument(
+        '--jobs',
+        help="Path to YAML or JSON file with many searches, crawled in one run instead of the single search given by "
+             "filter arguments",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--max-active-jobs',
+        help="Max number of jobs crawled at once, their ads are interleaved",
+        type=int,
+        default=DEFAULT_MAX_ACTIVE
+    )
+    parser.add_argument(
+        '--profile-extraction',
+        help="Measure extraction cost of every ad's field and print it as JSON once the crawl ends (only for ads "
+             "parsed in the main process)",
+        action='store_true'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        help="Serve crawler's metrics in Prometheus text format under http://<host>:<port>/metrics",
+        type=int,
+        default=None
+    )
+    parser.add_argument(
+        '--metrics-file',
+        help="Path to JSON file periodically replaced with snapshot of crawler's metrics",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        help="Time in seconds between snapshots written to --metrics-file",
+        type=float,
+        default=DEFAULT_SNAPSHOT_INTERVAL
+    )
+    parser.add_argument(
+        '--profile',
+        help="Profile the crawl with cProfile and save stats to given path (readable by pstats or snakeviz). "
+             "cProfile sees only the main thread (scraping and saving ads), not the fetcher-loop and "
+             "pipeline-buffer threads - sample the whole process with py-spy to see them, threads are named",
+        type=str,
+        default=None
+    )
+    parser.add_argument(
+        '--log-level',
+        help='Level of logged messages',
+        type=str,
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        default='INFO'
+    )
     args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.resume and not args.queue_path:
+        parser.error('--resume requires --queue-path')
+    if args.incremental and args.queue_path:
+        parser.error('--incremental can not be combined with --queue-path')
+    if args.adaptive_rate and not args.requests_per_second:
+        parser.error('--adaptive-rate requires --requests-per-second')
+    if not args.jobs and not args.car_brand:
+        parser.error('--car-brand is required unless --jobs is given')
+    if args.jobs and args.incremental:
+        parser.error('--incremental can not be combined with --jobs')
+
+    jobs = None
+    if args.jobs:
+        try:
+            jobs = load_jobs(args.jobs)
+        except ValueError as error:
+            parser.error(str(error))
+
+    configure_parser(args.parser, args.profile_extraction)
+    configure_parser_pool(args.parser_workers, args.parser)
+
+    cache = None
+    if args.cache_dir:
+        cache = ResponseCache(args.cache_dir, args.search_ttl, args.ad_ttl, args.cache_size * 1024 ** 2)
+    configure_count_probe(os.path.join(args.cache_dir, COUNTS_FILE_NAME) if args.cache_dir else None, args.count_ttl)
+
+    controller = None
+    if args.adaptive_rate:
+        controller = AdaptiveRateController(
+            args.requests_per_second, args.min_requests_per_second, args.max_requests_per_second
+        )
+
+    configure_fetcher(
+        max_concurrency=args.max_concurrency,
+        requests_per_second=args.requests_per_second,
+        max_retries=args.max_retries,
+        timeout=(DEFAULT_TIMEOUT[0], args.timeout),
+        cache=cache,
+        controller=controller,
+        revalidation=RevalidationStore(args.revalidate, args.revalidate_max_age * 3600) if args.revalidate else None,
+    )
 
-    search_pages_urls = URLCreator().get_search_page_links(
-        car_brand=CAR_BRANDS[args.car_brand][BRAND_CODE],
-        car_type=CAR_BRANDS[args.car_brand][BRAND_TYPES][args.car_type],
+    model = None
+    if not jobs:
+        try:
+            model = CATALOG.find(args.car_brand, args.car_type)
+        except ValueError as error:
+            parser.error(str(error))
+
+    search = SearchFilter(
+        car_brand=model.brand_code if model else None,
+        car_type=model.code if model else None,
         min_price=args.min_price,
         max_price=args.max_price,
         base_url=args.base_url,
@@ -278,18 +693,237 @@ def main():
         max_mileage=args.max_mileage,
     )
 
-    ads_urls = []
-    for url in search_pages_urls:
-        ads_urls += search_urls(url)
+    def plan_search_pages() -> List[str]:
+        if jobs:
+            return list(chain.from_iterable(JobPlanner().plan(jobs)))
+        return [partition.url for partition in URLCreator().plan_searches(search)]
+
+    ad_index = AdIndex(args.seen_ads)
+    sink = create_sink(
+        args.output_format, args.output_dir, max_records=args.part_size, max_seconds=args.part_seconds
+    )
+    if args.history:
+        sink = TeeSink(sink, AdHistory(args.history))
+
+    metrics_server = serve_metrics(args.metrics_port) if args.metrics_port is not None else None
+    snapshots = SnapshotWriter(args.metrics_file, args.metrics_interval) if args.metrics_file else None
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        if args.queue_path:
+            queue = WorkQueue(args.queue_path, max_attempts=args.max_attempts, lease_timeout=args.lease_timeout)
+            if not args.resume:
+                queue.clear()
+            else:
+                released = queue.release_dead()
+                if released:
+                    logging.info(f'Released {released} tasks left in flight by dead workers')
+            if not queue.has_tasks(SEARCH_TASK):
+                queue.put_many(SEARCH_TASK, ((url, url) for url in plan_search_pages()))
+            crawl_with_queue(queue, ad_index=ad_index, sink=sink)
+            queue.close()
+        elif args.incremental:
+            state = SearchStateStore(args.incremental)
+            search_url = search.url
+            if state.newest_ids(search_url):
+                crawl_incremental(search_url, state, ad_index, sink)
+            else:
+                newest_ids = [extract_ad_id(url) for url in get_ads_urls(search_url)]
+                crawl(plan_search_pages(), args.buffer_size, ad_index, sink)
+                update_search_state(state, search_url, newest_ids, ad_index)
+        elif jobs:
+            crawl_jobs(jobs, args.max_active_jobs, args.buffer_size, ad_index, sink)
+        else:
+            crawl(plan_search_pages(), args.buffer_size, ad_index, sink)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logging.info(f'Profile saved to {args.profile}')
+        if snapshots is not None:
+            snapshots.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        sink.close()
+        ad_index.close()
+
+    configure_parser_pool(0)
+
+    if args.profile_extraction:
+        # Printed rather than logged, so the requested report is shown regardless of --log-level
+        print(json.dumps(get_parser().extraction_report(), indent=2))
+
+
+def crawl(search_pages_urls: List[str], buffer_size: int = DEFAULT_BUFFER_SIZE, ad_index: AdIndex = None,
+          sink: Sink = None):
+    """
+    Scrape and save all ads found under given search pages. Stages are streamed: ads are scraped while search pages
+    are still paginated, with at most buffer_size discovered ads waiting to be scraped.
+
+    :param search_pages_urls: URLs to pages with search results (without page selection)
+    :param buffer_size: Max number of buffered ad's urls between search and scrape stages
+    :param ad_index: [Optional] Index of already scraped ads, which are skipped
+    :param sink: [Optional] Destination of scraped ads, by default ad_{id}.json files in current directory
+    """
+    ads_urls = chain.from_iterable(search_urls(url) for url in search_pages_urls)
+    save_ads(ads_urls, buffer_size, ad_index, sink)
+
+
+def crawl_jobs(jobs: List[Job], max_active_jobs: int = DEFAULT_MAX_ACTIVE, buffer_size: int = DEFAULT_BUFFER_SIZE,
+               ad_index: AdIndex = None, sink: Sink = None):
+    """
+    Scrape and save ads of many jobs through one fetcher and one scrape stage. Active jobs take turns in providing
+    ads, so a large job doesn't starve the others. Search pages and ads shared by several jobs are processed once.
+
+    :param jobs: Jobs to crawl, planned lazily in order
+    :param max_active_jobs: Max number of jobs searched at once
+    :param buffer_size: Max number of buffered ad's urls between search and scrape stages
+    :param ad_index: [Optional] Index of already scraped ads, which are skipped
+    :param sink: [Optional] Destination of scraped ads, by default ad_{id}.json files in current directory
+    """
+    jobs_ads_urls = (
+        chain.from_iterable(search_urls(url) for url in search_pages_urls)
+        for search_pages_urls in JobPlanner().plan(jobs)
+    )
+    save_ads(round_robin(jobs_ads_urls, max_active_jobs), buffer_size, ad_index, sink)
+
+
+def save_ads(ads_urls: Iterable[str], buffer_size: int = DEFAULT_BUFFER_SIZE, ad_index: AdIndex = None,
+             sink: Sink = None):
+    """
+    Scrape and save ads which are not in the index yet
+
+    :param ads_urls: URLs to ads, may contain duplicates
+    :param buffer_size: Max number of buffered ad's urls before scraping
+    :param ad_index: [Optional] Index of already scraped ads, which are skipped
+    :param sink: [Optional] Destination of scraped ads, by default ad_{id}.json files in current directory
+    """
+    ad_index = ad_index if ad_index is not None else AdIndex()
+    sink = sink if sink is not None else JsonFileSink()
+    ads_urls = buffered(ad_index.unique(ads_urls), buffer_size, BUFFERED_URLS)
 
-    ads_urls = extract_unique_ads(ads_urls)
+    saver = AdSaver(ad_index, sink)
+    progress = Progress()
+    try:
+        for scraped_ad in scrape_cars(ads_urls):
+            progress.update(saver.save(scraped_ad))
+    finally:
+        saver.flush()
+    logging.info(f'Completed. {progress.summary()}')
+
+
+def crawl_incremental(search_url: str, state: SearchStateStore, ad_index: AdIndex = None, sink: Sink = None):
+    """
+    Scrape and save only ads added under the search since its last crawl
+
+    :param search_url: URL to page with search results sorted by creation time (without page selection)
+    :param state: Store with the newest ads of already crawled searches
+    :param ad_index: [Optional] Index of already scraped ads, which are skipped
+    :param sink: [Optional] Destination of scraped ads, by default ad_{id}.json files in current directory
+    """
+    ad_index = ad_index if ad_index is not None else AdIndex()
+    sink = sink if sink is not None else JsonFileSink()
+    new_ads_urls = list(search_new_ads_urls(search_url, set(state.newest_ids(search_url))))
 
-    urls_number = len(ads_urls)
-    for n, link in enumerate(ads_urls):
-        scraped_ad = scrape_car(link)
-        if scraped_ad:
-            save_scraped_results(scraped_ad)
-        logging.info(f'Completed {round(n/urls_number)}%')
+    saver = AdSaver(ad_index, sink)
+    progress = Progress(len(new_ads_urls))
+    try:
+        for scraped_ad in scrape_cars(ad_index.unique(new_ads_urls)):
+            progress.update(saver.save(scraped_ad))
+    finally:
+        saver.flush()
+
+    update_search_state(state, search_url, [extract_ad_id(url) for url in new_ads_urls], ad_index)
+    logging.info(f'Completed, found {len(new_ads_urls)} new ads. {progress.summary()}')
+
+
+def update_search_state(state: SearchStateStore, search_url: str, new_ids: List[str], ad_index: AdIndex):
+    """
+    Remember the newest ads of the crawled search, but only older than any ad which wasn't written. Pagination of the
+    next crawl stops at the first known ad, so ads which failed (ex. were blocked) are found and retried again.
+
+    :param state: Store with the newest ads of already crawled searches
+    :param search_url: URL to page with search results sorted by creation time (without page selection)
+    :param new_ids: Ids of ads found during the crawl, newest first
+    :param ad_index: Index of ads written by this and previous crawls
+    """
+    missing = [n for n, ad_id in enumerate(new_ids) if ad_id not in ad_index]
+    if missing:
+        logging.warning(f'{len(missing)} new ads under {search_url} were not scraped, the next crawl retries them')
+    state.update(search_url, new_ids[missing[-1] + 1:] if missing else new_ids)
+
+
+def crawl_with_queue(queue: WorkQueue, batch_size: int = 100, ad_index: AdIndex = None, sink: Sink = None,
+                     poll_interval: float = QUEUE_POLL_INTERVAL):
+    """
+    Process search and ad tasks from durable queue until all of them are done or failed. Search pages are processed
+    first and ads found on them are added to the queue, ads already known to the queue are skipped. Tasks in flight
+    of other workers are waited for, as they may add ads or be abandoned and claimed again after lease timeout.
+
+    :param queue: Queue with search pages tasks
+    :param batch_size: Number of ads claimed at once
+    :param ad_index: [Optional] Index of already scraped ads, which are not added to the queue
+    :param sink: [Optional] Destination of scraped ads, by default ad_{id}.json files in current directory
+    :param poll_interval: [Optional] Time in seconds between claims while only other workers have tasks in flight
+    """
+    ad_index = ad_index if ad_index is not None else AdIndex()
+    saver = AdSaver(ad_index, sink if sink is not None else JsonFileSink())
+    progress = Progress()
+    try:
+        while True:
+            QUEUE_TASKS.set(sum(
+                count for kind in (SEARCH_TASK, AD_TASK) for status, count in queue.counts(kind).items()
+                if status in (PENDING, IN_FLIGHT)
+            ))
+            tasks = queue.claim(SEARCH_TASK)
+            if tasks:
+                process_search_task(queue, tasks[0], ad_index)
+                continue
+
+            tasks = queue.claim(AD_TASK, batch_size)
+            if tasks:
+                process_ad_tasks(queue, tasks, saver, progress)
+                continue
+
+            # Own tasks waiting in sink's buffer are done once written, the rest belongs to other workers
+            saver.flush()
+            in_flight = sum(queue.counts(kind).get(IN_FLIGHT, 0) for kind in (SEARCH_TASK, AD_TASK))
+            if not in_flight:
+                break
+            logging.info(f'Waiting for {in_flight} tasks in flight of other workers')
+            time.sleep(poll_interval)
+    finally:
+        saver.flush()
+
+    logging.info(f'Completed. {progress.summary()}')
+    logging.info(f'Search pages: {queue.counts(SEARCH_TASK)}, ads: {queue.counts(AD_TASK)}')
+
+
+def process_search_task(queue: WorkQueue, task: Task, ad_index: AdIndex):
+    try:
+        ads_urls = list(ad_index.unique(search_urls(task.url, raise_errors=True)))
+    except Exception as e:
+        logging.warning(f'Failed to search {task.url}: {e}')
+        queue.mark_failed(task, str(e))
+        return
+
+    added = queue.put_many(AD_TASK, ((extract_ad_id(url), url) for url in ads_urls))
+    queue.mark_done(task)
+    logging.info(f'Found {len(ads_urls)} ads ({added} new) under {task.url}')
+
+
+def process_ad_tasks(queue: WorkQueue, tasks: List[Task], saver: AdSaver, progress: Progress = None):
+    # Ads buffered for longer than lease timeout are claimed again, they are done once the buffer is written
+    tasks = [task for task in tasks if not saver.is_pending(task.key)]
+    for task, scraped_ad in zip(tasks, scrape_cars(task.url for task in tasks)):
+        # Task is done only once its ad is written, ads buffered by the sink are claimed again after a crash
+        result = saver.save(scraped_ad, partial(queue.mark_done, task))
+        if result == FAILED:
+            queue.mark_failed(task, 'Ad could not be scraped')
+        if progress is not None:
+            progress.update(result)
 
 
 if __name__ == '__main__':
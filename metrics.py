@@ -0,0 +1,349 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_SNAPSHOT_INTERVAL = 30.0
+DEFAULT_PROGRESS_EVERY = 100
+
+# Results of processing an ad
+SCRAPED = 'scraped'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _render_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Metric:
+    """
+    Named metric, thread safe
+    """
+    kind: str
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        """
+        :return: Iterator of sample name, labels and value
+        """
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value, optionally split by labels
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """
+        :param labels: [Optional] Labels of the value, sum of all values if not given
+        :return: Current value
+        """
+        with self._lock:
+            if labels:
+                return self._values.get(_labels(labels), 0)
+            return sum(self._values.values())
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, labels, value
+
+    def snapshot(self):
+        with self._lock:
+            if list(self._values) in ([], [()]):
+                return self._values.get((), 0)
+            return {','.join(f'{key}={value}' for key, value in labels): value
+                    for labels, value in sorted(self._values.items())}
+
+
+class Gauge(Metric):
+    """
+    Value which goes up and down, either set directly or read from a function when collected
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function: Optional[Callable[[], float]]):
+        """
+        :param function: Function returning current value or None to use set value again
+        """
+        with self._lock:
+            self._function = function
+
+    def value(self) -> float:
+        with self._lock:
+            function, value = self._function, self._value
+        return function() if function is not None else value
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        yield self.name, (), self.value()
+
+    def snapshot(self):
+        return self.value()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets, with their sum and count
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect_left(self.buckets, value)] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        """
+        Observe duration of the block in seconds
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self) -> Iterator[Tuple[str, Labels, float]]:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative = 0
+        for bound, bucket_count in zip([*self.buckets, float('inf')], counts):
+            cumulative += bucket_count
+            yield f'{self.name}_bucket', (('le', '+Inf' if bound == float('inf') else repr(bound)),), cumulative
+        yield f'{self.name}_sum', (), total
+        yield f'{self.name}_count', (), count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'count': self._count,
+                'sum': self._sum,
+                'mean': self._sum / self._count if self._count else None,
+                'buckets': dict(zip([*map(repr, self.buckets), '+Inf'], self._counts)),
+            }
+
+
+class Registry:
+    """
+    Collection of crawler's metrics, rendered in Prometheus text format or as JSON snapshot
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._register(Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._register(Gauge(name, description))
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, buckets))
+
+    def metrics(self) -> List[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        """
+        :return: All metrics in Prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics():
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_render_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """
+        :return: All metrics as JSON serializable dict
+        """
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': time.time() - self.started_at,
+            'metrics': {metric.name: metric.snapshot() for metric in self.metrics()},
+        }
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.histogram('scraper_fetch_seconds', 'Latency of single HTTP requests')
+RESPONSES = REGISTRY.counter('scraper_responses_total', 'HTTP responses by status')
+FETCH_ERRORS = REGISTRY.counter('scraper_fetch_errors_total', 'HTTP requests failed without response')
+DOWNLOADED_BYTES = REGISTRY.counter('scraper_downloaded_bytes_total', 'Bytes of downloaded page contents')
+CACHE_REQUESTS = REGISTRY.counter('scraper_cache_requests_total', 'Response cache lookups by result (hit or miss)')
+COUNT_PROBES = REGISTRY.counter('scraper_count_probes_total', 'Search result count lookups by result (hit or miss)')
+BLOCK_SIGNALS = REGISTRY.counter('scraper_block_signals_total', 'Signs of being blocked by kind')
+PARSE_SECONDS = REGISTRY.histogram('scraper_parse_seconds', 'Time of parsing single ad page in the main process')
+SEARCH_PAGES = REGISTRY.counter('scraper_search_pages_total', 'Paginated search result pages')
+ADS = REGISTRY.counter('scraper_ads_total', 'Processed ads by result (scraped, unchanged or failed)')
+NOT_MODIFIED = REGISTRY.counter('scraper_not_modified_total', 'Unchanged ads by how it was detected')
+BUFFERED_URLS = REGISTRY.gauge('scraper_buffered_urls', "Ad's urls waiting between search and scrape stages")
+QUEUE_TASKS = REGISTRY.gauge('scraper_queue_pending_tasks', 'Tasks left in the work queue')
+
+
+class Progress:
+    """
+    Counts processed ads and periodically logs throughput, failures and - if number of ads is known - completion
+    """
+
+    def __init__(self, total: Optional[int] = None, every: int = DEFAULT_PROGRESS_EVERY):
+        """
+        :param total: [Optional] Number of ads to process
+        :param every: Number of processed ads between log messages
+        """
+        self.total = total
+        self.every = every
+        self.processed = 0
+        self.results: Dict[str, int] = {SCRAPED: 0, UNCHANGED: 0, FAILED: 0}
+        self.started = time.perf_counter()
+
+    def update(self, result: str):
+        """
+        :param result: Result of processing an ad - SCRAPED, UNCHANGED or FAILED
+        """
+        self.processed += 1
+        self.results[result] += 1
+        ADS.inc(result=result)
+        if self.processed % self.every == 0:
+            logging.info(self.summary())
+
+    def summary(self) -> str:
+        seconds = time.perf_counter() - self.started
+        rate = self.processed / seconds if seconds else 0.0
+        completed = f' ({self.processed / self.total:.1%})' if self.total else ''
+        unchanged = f', {self.results[UNCHANGED]} unchanged' if self.results[UNCHANGED] else ''
+        return f'Processed {self.processed}{f"/{self.total}" if self.total else ""} ads{completed}, ' \
+               f'{self.results[FAILED]} failed{unchanged}, {rate:.1f} ads/s, {seconds:.0f}s elapsed'
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve_metrics(port: int, registry: Registry = REGISTRY) -> HTTPServer:
+    """
+    Serve metrics in Prometheus text format under /metrics from a background thread
+
+    :param port: Port to listen on (all interfaces)
+    :param registry: [Optional] Registry with metrics
+    :return: Running server, stop it with shutdown()
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = _Server(('', port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
+
+class SnapshotWriter:
+    """
+    Periodically writes JSON snapshot of metrics to a file, replacing it atomically
+    """
+
+    def __init__(self, path: str, interval: float = DEFAULT_SNAPSHOT_INTERVAL, registry: Registry = REGISTRY):
+        """
+        :param path: Path to JSON file
+        :param interval: Time between snapshots in seconds
+        :param registry: [Optional] Registry with metrics
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshots', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(self.registry.snapshot(), file, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        """
+        Stop periodic snapshots and write the final one
+        """
+        self._stopped.set()
+        self._thread.join()
+        self.write()
@@ -0,0 +1,193 @@
+import argparse
+import glob
+import json
+import os
+from typing import Callable, Dict, Iterable, List
+
+import pandas
+from pandas.api.extensions import take
+
+from sinks import AD_COLUMNS, EXTRA_TECHNICAL_DATA_COLUMN, column_name
+
+PRICE = 'price'
+MILEAGE = 'mileage'
+POWER = 'power'
+FIRST_REGISTRATION = 'first_registration'
+CUBIC_CAPACITY = 'cubic_capacity'
+NUMBER_OF_SEATS = 'number_of_seats'
+NUMBER_OF_DOORS = 'number_of_doors'
+FUEL = 'fuel'
+
+# Technical data keys (as column names) of English and German pages
+COLUMN_ALIASES = {
+    'price': PRICE,
+    'preis': PRICE,
+    'mileage': MILEAGE,
+    'kilometerstand': MILEAGE,
+    'power': POWER,
+    'leistung': POWER,
+    'first_registration': FIRST_REGISTRATION,
+    'erstzulassung': FIRST_REGISTRATION,
+    'cubic_capacity': CUBIC_CAPACITY,
+    'hubraum': CUBIC_CAPACITY,
+    'number_of_seats': NUMBER_OF_SEATS,
+    'anzahl_sitzplätze': NUMBER_OF_SEATS,
+    'num_seats': NUMBER_OF_SEATS,
+    'number_of_doors': NUMBER_OF_DOORS,
+    'anzahl_der_türen': NUMBER_OF_DOORS,
+    'door_count': NUMBER_OF_DOORS,
+    'fuel': FUEL,
+    'kraftstoffart': FUEL,
+}
+
+STRING_COLUMNS = ('title', 'loc')
+
+
+def records_to_frame(records: Iterable[Dict]) -> pandas.DataFrame:
+    """
+    Flatten scraped ads into a frame with raw string columns, named like in ParquetSink output
+
+    :param records: Scraped ads
+    :return: Frame with ad's columns and one column per technical data key
+    """
+    columns: Dict[str, str] = {}
+    rows = []
+    for record in records:
+        row = {column: record.get(column) for column in AD_COLUMNS}
+        for key, value in (record.get('technical_data') or {}).items():
+            if key not in columns:
+                columns[key] = column_name(key)
+            row.setdefault(columns[key], value)
+        rows.append(row)
+    return pandas.DataFrame(rows)
+
+
+def _parse_distinct(values: pandas.Series, parse: Callable[[pandas.Series], pandas.DataFrame]) -> pandas.DataFrame:
+    # Scraped values repeat a lot, so only distinct ones are parsed and results are spread back by category codes
+    categorical = values.astype('category')
+    parsed = parse(pandas.Series(categorical.cat.categories.astype('string')))
+    codes = categorical.cat.codes.to_numpy()
+    return pandas.DataFrame(
+        {column: take(parsed[column].array, codes, allow_fill=True) for column in parsed.columns}, index=values.index
+    )
+
+
+def _german_number(values: pandas.Series) -> pandas.DataFrame:
+    # German format: dots separate thousands and comma separates decimals, e.g. "1.968,5 cm³"
+    numbers = values.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pandas.DataFrame({
+        'value': pandas.to_numeric(numbers.str.extract(r'(\d+(?:\.\d+)?)', expand=False), errors='coerce')
+    })
+
+
+def _power(values: pandas.Series) -> pandas.DataFrame:
+    power = values.str.extract(r'(?P<kw>\d+)\s*kW\s*\((?P<ps>\d+)\s*(?:PS|hp)\)')
+    return power.apply(pandas.to_numeric, errors='coerce')
+
+
+def _month(values: pandas.Series) -> pandas.DataFrame:
+    return pandas.DataFrame({
+        'value': pandas.to_datetime(values.str.extract(r'(\d{2}/\d{4})', expand=False), format='%m/%Y', errors='coerce')
+    })
+
+
+def _compact_integer(values: pandas.Series) -> pandas.Series:
+    values = values.astype('float64')
+    if values.isna().any():
+        return values.astype('float32')
+    return pandas.to_numeric(values, downcast='unsigned')
+
+
+def normalize_frame(frame: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Convert raw string columns of scraped ads into typed, compact columns. All conversions are vectorized string
+    operations on whole columns. Price, mileage, cubic capacity and seats become numbers, power is split into power_kw
+    and power_ps, first registration becomes a month timestamp, ad's id an integer and remaining technical data
+    columns categoricals. Number of doors is a categorical too, as its values are ranges like "4/5".
+
+    :param frame: Frame created by records_to_frame or read from ParquetSink output
+    :return: Normalized frame
+    """
+    frame = frame.rename(columns=lambda column: COLUMN_ALIASES.get(column_name(column), column))
+    result = pandas.DataFrame(index=frame.index)
+
+    if 'id' in frame:
+        result['id'] = pandas.to_numeric(frame['id'], errors='coerce').astype('Int64')
+
+    for column in STRING_COLUMNS:
+        if column in frame:
+            result[column] = frame[column].astype('string')
+
+    for column in (PRICE, MILEAGE, CUBIC_CAPACITY, NUMBER_OF_SEATS):
+        if column in frame:
+            result[column] = _compact_integer(_parse_distinct(frame[column], _german_number)['value'])
+
+    if POWER in frame:
+        power = _parse_distinct(frame[POWER], _power)
+        result['power_kw'] = _compact_integer(power['kw'])
+        result['power_ps'] = _compact_integer(power['ps'])
+
+    if FIRST_REGISTRATION in frame:
+        result[FIRST_REGISTRATION] = _parse_distinct(frame[FIRST_REGISTRATION], _month)['value']
+
+    if 'rbt_features' in frame:
+        result['rbt_features'] = frame['rbt_features']
+
+    converted = {'id', 'rbt_features', POWER, EXTRA_TECHNICAL_DATA_COLUMN, *STRING_COLUMNS, *result.columns}
+    for column in frame.columns:
+        if column not in converted:
+            result[column] = frame[column].astype('category')
+
+    return result
+
+
+def normalize_ads(records: Iterable[Dict]) -> pandas.DataFrame:
+    """
+    :param records: Scraped ads
+    :return: Normalized frame, see normalize_frame
+    """
+    return normalize_frame(records_to_frame(records))
+
+
+def read_scraped_ads(directory: str) -> pandas.DataFrame:
+    """
+    Read all ads written by any sink into a single raw frame
+
+    :param directory: Output directory of scraping
+    :return: Frame with raw string columns
+    """
+    parquet_files = sorted(glob.glob(os.path.join(directory, '*.parquet')))
+    if parquet_files:
+        return pandas.concat([pandas.read_parquet(path) for path in parquet_files], ignore_index=True)
+
+    records: List[Dict] = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl'))):
+        with open(path) as file:
+            records.extend(json.loads(line) for line in file)
+    for path in sorted(glob.glob(os.path.join(directory, 'ad_*.json'))):
+        with open(path) as file:
+            records.append(json.load(file))
+    return records_to_frame(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Normalize scraped car ads into typed columns')
+    parser.add_argument(
+        'input_dir',
+        help="Output directory of scraping with json, jsonl or parquet files",
+        type=str
+    )
+    parser.add_argument(
+        'output',
+        help="Path to Parquet file with normalized ads",
+        type=str
+    )
+    args = parser.parse_args()
+
+    frame = normalize_frame(read_scraped_ads(args.input_dir))
+    frame.to_parquet(args.output, index=False)
+    print(f'Normalized {len(frame)} ads, {frame.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB in memory')
+
+
+if __name__ == '__main__':
+    main()
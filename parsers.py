@@ -0,0 +1,431 @@
+import logging
+import multiprocessing
+from collections import deque, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+from ad_index import extract_ad_id
+from extraction import Extractor, FieldSpec, Match, START, END
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+BS4 = 'bs4'
+LXML = 'lxml'
+
+AD_LINK_CLASS = 'link--muted no--text--decoration result-item'
+PAGE_BUTTON_CLASS = 'btn btn--muted btn--s'
+RESULTS_HEADLINE_CLASS = 'h2 u-text-orange rbt-result-list-headline'
+TECHNICAL_DATA_CLASS = 'cBox-body cBox-body--technical-data'
+PRICE_CLASS = 'g-col-6 vip-price-rating__tech-details'
+TECHNICAL_ROW_CLASS = 'g-row u-margin-bottom-9'
+COLUMN_CLASS = 'g-col-6'
+# Ad's data shown in search results: price and registration, mileage and power
+SUMMARY_CLASSES = ('price-block', 'rbt-regMilPow')
+SUMMARY_SEPARATOR = ' | '
+
+HEADLINE_CHUNK_SIZE = 16 * 1024
+
+AD_FIELDS = (
+    FieldSpec('title', 'h1', 'id', 'rbt-ad-title'),
+    FieldSpec('loc', 'p', 'id', 'rbt-seller-address'),
+    FieldSpec('technical_data', 'div', 'class', TECHNICAL_DATA_CLASS),
+    FieldSpec('price', 'div', 'class', PRICE_CLASS, many=True, scope='technical_data'),
+    FieldSpec('technical_rows', 'div', 'class', TECHNICAL_ROW_CLASS, many=True, scope='technical_data'),
+    FieldSpec('technical_columns', 'div', 'class', COLUMN_CLASS, many=True, scope='technical_rows'),
+    FieldSpec('rbt_features', 'div', 'id', 'rbt-features'),
+    FieldSpec('features', 'div', 'class', COLUMN_CLASS, many=True, scope='rbt_features'),
+)
+
+
+class PageParser:
+    """
+    Interface of mobile.de pages parsers. Every backend has to return exactly the same results. Ad pages are
+    extracted in a single traversal according to AD_FIELDS spec.
+    """
+    name: str
+
+    def __init__(self, profile: bool = False):
+        """
+        :param profile: If True time spent on extraction of every ad's field is measured
+        """
+        self.extractor = Extractor(AD_FIELDS, profile)
+
+    def extraction_report(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: Extraction cost of every ad's field accumulated over all parsed ads
+        """
+        return self.extractor.report()
+
+    def parse_ads_urls(self, content: str) -> List[str]:
+        """
+        :param content: Content of page with search results
+        :return: List of URLs to car's ads
+        """
+        raise NotImplementedError
+
+    def parse_ads_summaries(self, content: str) -> List[Tuple[str, str]]:
+        """
+        :param content: Content of page with search results
+        :return: List of URLs to car's ads (the same as parse_ads_urls) with ad's data shown in search results
+        """
+        raise NotImplementedError
+
+    def parse_max_page_number(self, content: str) -> int:
+        """
+        :param content: Content of page with search results
+        :return: Number of pages with search results
+        """
+        raise NotImplementedError
+
+    def parse_number_of_results(self, content: str) -> Optional[int]:
+        """
+        :param content: Content of page with search results
+        :return: Number of search results or None if headline with results count is missing
+        """
+        raise NotImplementedError
+
+    def parse_car(self, url: str, content: str) -> Optional[Dict]:
+        """
+        :param url: URL with mobile.de ad
+        :param content: Content of ad's page
+        :return: Dict with scraped ad or None if ad couldn't be scraped
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _summary(texts: Iterable[str]) -> str:
+        return SUMMARY_SEPARATOR.join(' '.join(text.split()) for text in texts)
+
+    @staticmethod
+    def _parse_results_headline(text: str) -> int:
+        return int(text.split(' ')[0].replace('.', ''))
+
+    @staticmethod
+    def _parse_price(text: str) -> str:
+        return text.split('€')[0].rstrip()
+
+    def _build_car(self, url: str, fields: Dict[str, List[Match]], text: Callable[[Any], str]) -> Optional[Dict]:
+        if not fields['technical_data'] and not fields['rbt_features']:
+            return None
+
+        if not fields['title'] or not fields['loc']:
+            logging.warning(f'Title or seller address not found under {url}. You may be blocked!')
+            return None
+
+        technical_data = None
+        if fields['technical_data']:
+            technical_data = {}
+            if len(fields['price']) == 1:
+                technical_data['price'] = self._parse_price(text(fields['price'][0].element))
+            else:
+                logging.warning('Price was not identified')
+
+            columns = defaultdict(list)
+            for column in fields['technical_columns']:
+                columns[column.parent].append(column.element)
+            for row_n in range(len(fields['technical_rows'])):
+                name, value = columns[row_n][:2]
+                technical_data[text(name)] = text(value)
+
+        rbt_features = None
+        if fields['rbt_features']:
+            rbt_features = [text(feature.element) for feature in fields['features']]
+
+        return {
+            'id': extract_ad_id(url),
+            'title': text(fields['title'][0].element),
+            'rbt_features': rbt_features,
+            'technical_data': technical_data,
+            'loc': text(fields['loc'][0].element)
+        }
+
+
+def extract_single_value(features_tag: Tag) -> Tuple[str, str]:
+    """
+    Extract single value from structured form of tag (like technical features)
+
+    :param features_tag: Tag with structured form of data
+    :return: Tuple of name and value
+    """
+    res = features_tag.find_all('div', class_=COLUMN_CLASS)
+    name = res[0].text
+    value = res[1].text
+    return name, value
+
+
+def extract_technical_data(technical_data: Tag) -> Dict[str, str]:
+    """
+    Extract car's technical data (common structure across different ads)
+
+    :param technical_data: Tag with div g-col-6 vip-price-rating__tech-details class
+    :return: Dict with technical data key words and values
+    """
+    results = {}
+    price_results = technical_data.find_all('div', class_=PRICE_CLASS)
+
+    if len(price_results) == 1:
+        results['price'] = PageParser._parse_price(price_results[0].text)
+
+    else:
+        logging.warning('Price was not identified')
+
+    rest_info = technical_data.find_all('div', class_=TECHNICAL_ROW_CLASS)
+    for tag in rest_info:
+        name, value = extract_single_value(tag)
+        results[name] = value
+
+    return results
+
+
+def extract_rbt_features(rbt_features: Tag) -> List[str]:
+    """
+    Extract rbt features from provided tag
+
+    :param rbt_features: Tag with div g-col-6 class
+    :return: List of car's features
+    """
+    results = []
+    for tag in rbt_features.find_all('div', {'class': COLUMN_CLASS}):
+        results.append(tag.text)
+
+    return results
+
+
+class Bs4Parser(PageParser):
+    """
+    Pure python parser based on BeautifulSoup and html.parser
+    """
+    name = BS4
+
+    def parse_ads_urls(self, content: str) -> List[str]:
+        soup = BeautifulSoup(content, features="html.parser")
+        results = soup.findAll('a', class_=AD_LINK_CLASS)
+        return [ad_url.attrs['href'] for ad_url in results if 'suchen.mobile.de' in ad_url.attrs['href']]
+
+    def parse_ads_summaries(self, content: str) -> List[Tuple[str, str]]:
+        soup = BeautifulSoup(content, features="html.parser")
+        return [
+            (link.attrs['href'], self._summary(tag.text for tag in link.find_all(class_=SUMMARY_CLASSES)))
+            for link in soup.findAll('a', class_=AD_LINK_CLASS) if 'suchen.mobile.de' in link.attrs['href']
+        ]
+
+    def parse_max_page_number(self, content: str) -> int:
+        soup = BeautifulSoup(content, features="html.parser")
+        tmp = soup.find_all('span', {'class': PAGE_BUTTON_CLASS})
+        values = [int(value.text) for value in tmp]
+        if values:
+            return max(values)
+        return 1
+
+    def parse_number_of_results(self, content: str) -> Optional[int]:
+        soup = BeautifulSoup(content, features="html.parser", parse_only=SoupStrainer('h1'))
+        results_n_tag = soup.find('h1', {'class': RESULTS_HEADLINE_CLASS})
+        if results_n_tag:
+            return self._parse_results_headline(results_n_tag.text)
+        return None
+
+    def parse_car(self, url: str, content: str) -> Optional[Dict]:
+        soup = BeautifulSoup(content, features="html.parser")
+        fields = self.extractor.extract(_walk_bs4(soup), lambda tag: tag.name, _bs4_attribute)
+        return self._build_car(url, fields, lambda tag: tag.text)
+
+
+def _walk_bs4(root: Tag) -> Iterator[Tuple[str, Tag]]:
+    stack = [(root, iter(root.contents))]
+    while stack:
+        parent, children = stack[-1]
+        for child in children:
+            if isinstance(child, Tag):
+                yield START, child
+                stack.append((child, iter(child.contents)))
+                break
+        else:
+            stack.pop()
+            yield END, parent
+
+
+def _bs4_attribute(tag: Tag, name: str) -> Optional[str]:
+    value = tag.get(name)
+    return ' '.join(value) if isinstance(value, list) else value
+
+
+def _has_class(class_name: str) -> str:
+    # XPath equivalent of BeautifulSoup's class matching: single class matches any of element's classes and
+    # several classes match the whole attribute
+    if ' ' in class_name:
+        return f"normalize-space(@class)='{class_name}'"
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+class LxmlParser(PageParser):
+    """
+    Parser based on lxml's compiled HTML parser, several times faster than bs4. Search pages are queried with
+    precompiled XPath expressions and ad pages are walked by lxml's iterwalk limited to tags used by AD_FIELDS.
+    """
+    name = LXML
+
+    def __init__(self, profile: bool = False):
+        super().__init__(profile)
+        xpath = lxml.etree.XPath
+        self._ads_links = xpath(f"//a[{_has_class(AD_LINK_CLASS)}]")
+        self._page_buttons = xpath(f"//span[{_has_class(PAGE_BUTTON_CLASS)}]")
+        self._summary_parts = xpath(f".//*[{' or '.join(_has_class(class_name) for class_name in SUMMARY_CLASSES)}]")
+
+    @staticmethod
+    def _document(content: str):
+        return lxml.html.document_fromstring(content) if content.strip() else lxml.html.Element('html')
+
+    @staticmethod
+    def _first_text(elements: List) -> Optional[str]:
+        return elements[0].text_content() if elements else None
+
+    def parse_ads_urls(self, content: str) -> List[str]:
+        hrefs = (link.get('href') for link in self._ads_links(self._document(content)))
+        return [href for href in hrefs if href is not None and 'suchen.mobile.de' in href]
+
+    def parse_ads_summaries(self, content: str) -> List[Tuple[str, str]]:
+        return [
+            (link.get('href'), self._summary(part.text_content() for part in self._summary_parts(link)))
+            for link in self._ads_links(self._document(content))
+            if link.get('href') is not None and 'suchen.mobile.de' in link.get('href')
+        ]
+
+    def parse_max_page_number(self, content: str) -> int:
+        values = [int(value.text_content()) for value in self._page_buttons(self._document(content))]
+        if values:
+            return max(values)
+        return 1
+
+    def parse_number_of_results(self, content: str) -> Optional[int]:
+        # Headline is at the top of the page, so content is fed in chunks and parsing stops right after it
+        parser = lxml.etree.HTMLPullParser(events=(END,), tag='h1')
+        for start in range(0, len(content), HEADLINE_CHUNK_SIZE):
+            parser.feed(content[start:start + HEADLINE_CHUNK_SIZE])
+            for _, element in parser.read_events():
+                if ' '.join((element.get('class') or '').split()) == RESULTS_HEADLINE_CLASS:
+                    return self._parse_results_headline(element.xpath('string()'))
+        return None
+
+    def parse_car(self, url: str, content: str) -> Optional[Dict]:
+        events = lxml.etree.iterwalk(self._document(content), events=(START, END), tag=self.extractor.tags)
+        fields = self.extractor.extract(events, lambda element: element.tag, lambda element, name: element.get(name))
+        return self._build_car(url, fields, lambda element: element.text_content())
+
+
+_parser: Optional[PageParser] = None
+
+
+def create_parser(name: str = LXML, profile: bool = False) -> PageParser:
+    """
+    :param name: Name of parser's backend - LXML or BS4
+    :param profile: If True time spent on extraction of every ad's field is measured
+    :return: Parser, bs4 one if requested backend is not installed
+    """
+    if name == LXML:
+        if lxml is not None:
+            return LxmlParser(profile)
+        logging.warning('lxml is not installed, falling back to bs4 parser')
+    return Bs4Parser(profile)
+
+
+def configure_parser(name: str, profile: bool = False) -> PageParser:
+    """
+    Replace shared parser with a new one using given backend
+
+    :param name: Name of parser's backend - LXML or BS4
+    :param profile: If True time spent on extraction of every ad's field is measured
+    :return: New shared parser
+    """
+    global _parser
+    _parser = create_parser(name, profile)
+    return _parser
+
+
+def get_parser() -> PageParser:
+    """
+    :return: Shared parser, created with the fastest available backend on first use
+    """
+    global _parser
+    if _parser is None:
+        _parser = create_parser()
+    return _parser
+
+
+def _parse_car(url: str, content: str) -> Optional[Dict]:
+    return get_parser().parse_car(url, content)
+
+
+class ParserPool:
+    """
+    Pool of worker processes parsing ad pages, so parsing is not limited to a single core by GIL and does not compete
+    with network I/O of the fetching process. Number of pages waiting for parsing is bounded, so a slow pool holds back
+    consumption of fetched pages.
+    """
+
+    def __init__(self, workers: int, parser_name: str = LXML, window: int = None):
+        """
+        :param workers: Number of parser processes
+        :param parser_name: Name of parser's backend used by workers - LXML or BS4
+        :param window: [Optional] Max number of pages submitted for parsing, by default twice the number of workers
+        """
+        self.window = window or 2 * workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=configure_parser, initargs=(parser_name,)
+        )
+
+    def parse_cars(self, pages: Iterable[Tuple[str, Optional[str]]]) -> Iterator[Optional[Dict]]:
+        """
+        Parse ad pages in worker processes
+
+        :param pages: Pairs of ad's URL and page content, None content is passed through as None result
+        :return: Iterator of scraped ads (None if ad couldn't be scraped) in the same order as pages
+        """
+        pending: Deque[Future] = deque()
+
+        for url, content in pages:
+            if content is None:
+                future = Future()
+                future.set_result(None)
+            else:
+                future = self._executor.submit(_parse_car, url, content)
+            pending.append(future)
+            if len(pending) >= self.window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self._executor.shutdown()
+
+
+_parser_pool: Optional[ParserPool] = None
+
+
+def configure_parser_pool(workers: int, parser_name: str = LXML) -> Optional[ParserPool]:
+    """
+    Replace shared parser pool with a new one
+
+    :param workers: Number of parser processes, 0 disables the pool and pages are parsed in the fetching process
+    :param parser_name: Name of parser's backend used by workers - LXML or BS4
+    :return: New shared parser pool or None if pool is disabled
+    """
+    global _parser_pool
+    if _parser_pool is not None:
+        _parser_pool.close()
+    _parser_pool = ParserPool(workers, parser_name) if workers > 0 else None
+    return _parser_pool
+
+
+def get_parser_pool() -> Optional[ParserPool]:
+    """
+    :return: Shared parser pool or None if pages are parsed in the fetching process
+    """
+    return _parser_pool
@@ -0,0 +1,98 @@
+import datetime
+import logging
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from search_filter import Dimension, SearchFilter
+
+MAX_RESULTS = 1000
+GOOD_SPLIT_RATIO = 0.25
+
+DIMENSIONS = (
+    Dimension('price', 'min_price', 'max_price', 0, 100000),
+    Dimension('mileage', 'min_mileage', 'max_mileage', 0, 500000),
+    Dimension('first_registration', 'min_first_registration', 'max_first_registration', 1900,
+              datetime.date.today().year, bounded=True),
+    Dimension('horse_power', 'min_horse_power', 'max_horse_power', 0, 1000, bounded=True),
+)
+
+
+class Split(NamedTuple):
+    dimension: Dimension
+    lower_search: SearchFilter
+    lower_results: int
+    upper_search: SearchFilter
+    upper_results: int
+
+
+class SearchPartitioner:
+    """
+    Plans a set of disjoint searches which together cover given search and each has at most max_results results.
+    Search is split in halves along price, mileage, first registration or horse power, the dimension is chosen by
+    probing counts of the lower halves and picking the most balanced split.
+    """
+
+    def __init__(self, count_results: Callable[[str], Optional[int]], dimensions: Tuple[Dimension, ...] = DIMENSIONS,
+                 max_results: int = MAX_RESULTS):
+        """
+        :param count_results: Function returning number of results under given search url
+        :param dimensions: Dimensions which may be split, in order of preference
+        :param max_results: Max number of results which may be paginated under single search
+        """
+        self.count_results = count_results
+        self.dimensions = dimensions
+        self.max_results = max_results
+
+    def plan(self, search: SearchFilter, number_of_results: int = None) -> List[SearchFilter]:
+        """
+        Create searches covering given search
+
+        :param search: Search to partition
+        :param number_of_results: [Optional] Known number of results of the whole search
+        :return: List of disjoint searches
+        """
+        if number_of_results is None:
+            number_of_results = self.count_results(search.url)
+
+        if number_of_results is None:
+            return [search]
+
+        return self._partition(search, number_of_results)
+
+    def _partition(self, search: SearchFilter, number_of_results: int) -> List[SearchFilter]:
+        if number_of_results <= self.max_results:
+            return [search]
+
+        split = self._choose_split(search, number_of_results)
+        if split is None:
+            logging.warning(f'{number_of_results} results for {search.url} can not be split, '
+                            f'only {self.max_results} will be found')
+            return [search]
+
+        return self._partition(split.lower_search, split.lower_results) + \
+            self._partition(split.upper_search, split.upper_results)
+
+    def _choose_split(self, search: SearchFilter, number_of_results: int) -> Optional[Split]:
+        best_split = None
+
+        for dimension in self.dimensions:
+            halves = search.split(dimension)
+            if halves is None:
+                continue
+
+            lower_search, upper_search = halves
+            lower_results = self.count_results(lower_search.url)
+            if lower_results is None:
+                continue
+
+            split = Split(dimension, lower_search, lower_results, upper_search, number_of_results - lower_results)
+            if best_split is None or self._imbalance(split) < self._imbalance(best_split):
+                best_split = split
+
+            if min(split.lower_results, split.upper_results) >= GOOD_SPLIT_RATIO * number_of_results:
+                break
+
+        return best_split
+
+    @staticmethod
+    def _imbalance(split: Split) -> int:
+        return abs(split.lower_results - split.upper_results)
@@ -0,0 +1,94 @@
+import queue
+import threading
+from collections import deque
+from typing import Iterable, Iterator, Optional, TypeVar
+
+from metrics import Gauge
+
+T = TypeVar('T')
+
+DEFAULT_BUFFER_SIZE = 200
+DEFAULT_MAX_ACTIVE = 4
+
+_END = object()
+
+
+def buffered(iterable: Iterable[T], size: int = DEFAULT_BUFFER_SIZE, depth: Optional[Gauge] = None) -> Iterator[T]:
+    """
+    Consume iterable on a background thread, so the producing stage runs ahead of the consumer by at most size items.
+    Exceptions raised by the producer are re-raised in the consumer.
+
+    :param iterable: Items produced by previous stage
+    :param size: Max number of buffered items
+    :param depth: [Optional] Gauge reporting number of buffered items
+    :return: Iterator of the same items
+    """
+    buffer = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_END, e))
+        else:
+            put((_END, None))
+
+    threading.Thread(target=produce, name='pipeline-buffer', daemon=True).start()
+    if depth is not None:
+        depth.set_function(buffer.qsize)
+
+    try:
+        while True:
+            item, error = buffer.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                return
+            yield item
+    finally:
+        stopped.set()
+        if depth is not None:
+            depth.set_function(None)
+
+
+def round_robin(iterables: Iterable[Iterable[T]], max_active: int = DEFAULT_MAX_ACTIVE) -> Iterator[T]:
+    """
+    Interleave items of several iterables, taking one item from every active iterable in turn. At most max_active
+    iterables are consumed at once, next one is started when an active one is exhausted. Iterables are created lazily,
+    so a generator of generators starts only the work which is being consumed.
+
+    :param iterables: Iterables to interleave
+    :param max_active: Max number of iterables consumed at once
+    :return: Iterator of items of all iterables
+    """
+    pending = iter(iterables)
+    active = deque()
+
+    def activate():
+        while len(active) < max_active:
+            iterable = next(pending, _END)
+            if iterable is _END:
+                return
+            active.append(iter(iterable))
+
+    activate()
+    while active:
+        iterator = active.popleft()
+        item = next(iterator, _END)
+        if item is _END:
+            activate()
+            continue
+        active.append(iterator)
+        yield item
@@ -0,0 +1,189 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from ad_index import extract_ad_id
+from cache import normalize_url
+
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+# How unchanged ad was detected
+LISTING = 'listing'
+VALIDATORS = 'validators'
+CONTENT = 'content'
+
+
+class Unchanged(NamedTuple):
+    """
+    Result of scraping an ad which didn't change since it was scraped last time
+    """
+    id: str
+
+
+def page_hash(content: str) -> str:
+    """
+    :param content: Page content
+    :return: Hash of the content
+    """
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def _key(url: str) -> str:
+    return extract_ad_id(url) or normalize_url(url)
+
+
+class RevalidationStore:
+    """
+    Remembers for every scraped ad its page's validators (ETag, Last-Modified), hash of its content and its summary
+    (price, registration, mileage, power) shown in search results when it was scraped. On a recrawl ads with the same
+    summary are not fetched at all, other ads are fetched with conditional requests and not parsed if content didn't
+    change. Ads are fetched unconditionally again once their state is older than max age, as the summary doesn't cover
+    the whole ad. State is saved only for scraped ads, once they are written to the output. Safe to share between
+    threads.
+    """
+
+    def __init__(self, path: str, max_age: float = DEFAULT_MAX_AGE):
+        """
+        :param path: Path to SQLite file with state, created if missing
+        :param max_age: Time in seconds after which ad is fetched and parsed regardless of its state
+        """
+        self.max_age = max_age
+        self._listed: Dict[str, str] = {}
+        self._validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._parsed: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'ad_id TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_hash TEXT NOT NULL, summary TEXT, '
+            'scraped_at REAL NOT NULL)'
+        )
+
+    def _state(self, key: str) -> Optional[Tuple[Optional[str], Optional[str], str, Optional[str]]]:
+        row = self._connection.execute(
+            'SELECT etag, last_modified, content_hash, summary, scraped_at FROM pages WHERE ad_id = ?', (key,)
+        ).fetchone()
+        if row is None or time.time() - row[4] > self.max_age:
+            return None
+        return row[:4]
+
+    def list(self, url: str, summary: str):
+        """
+        Remember summary of ad shown in search results of the current crawl
+
+        :param url: URL with mobile.de ad
+        :param summary: Ad's data shown in search results
+        """
+        with self._lock:
+            self._listed[_key(url)] = summary
+
+    def is_listing_unchanged(self, url: str) -> bool:
+        """
+        :param url: URL with mobile.de ad
+        :return: True if ad is listed with the same summary as when it was scraped
+        """
+        key = _key(url)
+        with self._lock:
+            summary = self._listed.get(key)
+            if summary is None:
+                return False
+            state = self._state(key)
+        return state is not None and state[3] == summary
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """
+        :param url: URL with mobile.de ad
+        :return: Headers of conditional request for ad's page, empty if validators are unknown
+        """
+        with self._lock:
+            state = self._state(_key(url))
+        if state is None:
+            return {}
+
+        headers = {}
+        if state[0]:
+            headers['If-None-Match'] = state[0]
+        if state[1]:
+            headers['If-Modified-Since'] = state[1]
+        return headers
+
+    def fetched(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """
+        Remember validators of fetched page, they are saved once the ad is scraped
+
+        :param url: URL with mobile.de ad
+        :param etag: Value of response's ETag header
+        :param last_modified: Value of response's Last-Modified header
+        """
+        with self._lock:
+            self._validators[_key(url)] = (etag, last_modified)
+
+    def is_content_unchanged(self, url: str, content_hash: str) -> bool:
+        """
+        :param url: URL with mobile.de ad
+        :param content_hash: Hash of fetched page content
+        :return: True if content is the same as when ad was scraped
+        """
+        with self._lock:
+            state = self._state(_key(url))
+        return state is not None and state[2] == content_hash
+
+    def parsed(self, url: str, content_hash: str):
+        """
+        Remember hash of successfully parsed ad's page, state is saved once the ad is written
+
+        :param url: URL with mobile.de ad
+        :param content_hash: Hash of ad's page content
+        """
+        with self._lock:
+            self._parsed[_key(url)] = content_hash
+
+    def scraped(self, ad_id: str):
+        """
+        Save state of parsed ad which was written to the output, ads not parsed since they were saved are ignored
+
+        :param ad_id: Ad's id
+        """
+        with self._lock:
+            content_hash = self._parsed.pop(ad_id, None)
+            if content_hash is None:
+                return
+            etag, last_modified = self._validators.pop(ad_id, (None, None))
+            self._connection.execute(
+                'INSERT OR REPLACE INTO pages (ad_id, etag, last_modified, content_hash, summary, scraped_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (ad_id, etag, last_modified, content_hash, self._listed.pop(ad_id, None), time.time())
+            )
+
+    def verified(self, url: str):
+        """
+        Mark ad whose page was fetched and found unchanged, so its state does not expire
+
+        :param url: URL with mobile.de ad
+        """
+        key = _key(url)
+        with self._lock:
+            etag, last_modified = self._validators.pop(key, (None, None))
+            self._connection.execute(
+                'UPDATE pages SET etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified), '
+                'summary = COALESCE(?, summary), scraped_at = ? WHERE ad_id = ?',
+                (etag, last_modified, self._listed.pop(key, None), time.time(), key)
+            )
+
+    def discard(self, url: str):
+        """
+        Drop validators of ad which couldn't be scraped
+
+        :param url: URL with mobile.de ad
+        """
+        key = _key(url)
+        with self._lock:
+            self._validators.pop(key, None)
+            self._parsed.pop(key, None)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
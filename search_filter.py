@@ -0,0 +1,206 @@
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+DEFAULT_URL = 'https://suchen.mobile.de/fahrzeuge/search.html?dam=0&isSearchRequest=true&sfmr=false&vc=Car&sortOption.sortBy=creationTime&sortOption.sortOrder=DESCENDING'
+
+SELLER_TYPE_ARG = 'adLimitation'
+COUNTRY_ARG = 'ce'
+CAR_TYPE_ARG = 'ms'
+PAGE_ARG = 'pageNumber'
+POWER_UNIT = 'PS'
+
+# Range filters and their query parameters, power parameters are arrays of a value and its unit
+RANGE_ARGS = {
+    'min_price': 'minPrice',
+    'max_price': 'maxPrice',
+    'min_horse_power': 'minPowerAsArray',
+    'max_horse_power': 'maxPowerAsArray',
+    'min_first_registration': 'minFirstRegistrationDate',
+    'max_first_registration': 'maxFirstRegistrationDate',
+    'min_mileage': 'minMileage',
+    'max_mileage': 'maxMileage',
+}
+POWER_ARGS = ('minPowerAsArray', 'maxPowerAsArray')
+FILTER_ARGS = (SELLER_TYPE_ARG, COUNTRY_ARG, CAR_TYPE_ARG, *RANGE_ARGS.values())
+
+
+class ParsableEnum(Enum):
+
+    @classmethod
+    def parse(cls, value: Union[str, 'ParsableEnum', None]):
+        """
+        :param value: Member, its value or case insensitive name
+        :return: Enum member or None if value is None
+        """
+        if value is None or isinstance(value, cls):
+            return value
+        for member in cls:
+            if value == member.value or str(value).upper() == member.name:
+                return member
+        raise ValueError(f'Unknown {cls.__name__} {value}')
+
+
+class SellerType(ParsableEnum):
+    PRIVATE = 'ONLY_FSBO_ADS'
+    DEALER = 'ONLY_DEALER_ADS'
+    COMPANY = 'ONLY_COMMERCIAL_FSBO_ADS'
+
+
+class Country(ParsableEnum):
+    GERMANY = 'DE'
+
+
+class Dimension(NamedTuple):
+    """
+    Range filter which may be split: names of its min and max fields, the lowest value and the value used as max of
+    open ranges. Open ceiling of a bounded dimension (ex. registration year) is a hard cap, open ranges of other
+    dimensions may grow past it.
+    """
+    name: str
+    min_arg: str
+    max_arg: str
+    floor: int
+    open_ceiling: int
+    bounded: bool = False
+
+
+class SearchFilter(NamedTuple):
+    """
+    Immutable set of search filters. Filters render a canonical URL with sorted query parameters, so equal searches
+    always have equal URLs, and filters are compared and hashed by that URL. Base URL carries parameters which are not
+    filters, like sorting.
+    """
+    base_url: str = DEFAULT_URL
+    seller_type: Optional[SellerType] = None
+    country: Optional[Country] = None
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_horse_power: Optional[int] = None
+    max_horse_power: Optional[int] = None
+    min_first_registration: Optional[int] = None
+    max_first_registration: Optional[int] = None
+    min_mileage: Optional[int] = None
+    max_mileage: Optional[int] = None
+    car_brand: Optional[int] = None
+    car_type: Union[int, str, None] = None
+
+    @property
+    def url(self) -> str:
+        """
+        :return: Canonical search URL (without page selection)
+        """
+        parsed = urlparse(self.base_url or DEFAULT_URL)
+        query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                 if key not in FILTER_ARGS]
+
+        for field, arg in RANGE_ARGS.items():
+            value = getattr(self, field)
+            if value is not None:
+                query.append((arg, str(value)))
+                if arg in POWER_ARGS:
+                    query.append((arg, POWER_UNIT))
+
+        seller_type = SellerType.parse(self.seller_type)
+        if seller_type is not None:
+            query.append((SELLER_TYPE_ARG, seller_type.value))
+
+        country = Country.parse(self.country)
+        if country is not None:
+            query.append((COUNTRY_ARG, country.value))
+
+        if self.car_brand is not None:
+            car_type = f';{self.car_type}' if self.car_type is not None else ''
+            query.append((CAR_TYPE_ARG, f'{self.car_brand}{car_type}'))
+
+        # Sorted by key only, values of array parameters keep their order
+        query.sort(key=lambda item: item[0])
+        return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, parsed.params,
+                           urlencode(query, safe=';'), ''))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SearchFilter):
+            return NotImplemented
+        return self.url == other.url
+
+    def __ne__(self, other) -> bool:
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self) -> int:
+        return hash(self.url)
+
+    @classmethod
+    def from_url(cls, url: str) -> 'SearchFilter':
+        """
+        :param url: Search URL, page selection is ignored
+        :return: Filters of the search, parameters which are not filters are kept in base URL
+        """
+        parsed = urlparse(url)
+        pairs = parse_qsl(parsed.query, keep_blank_values=True)
+        values: Dict[str, List[str]] = {}
+        for key, value in pairs:
+            values.setdefault(key, []).append(value)
+
+        def number(arg: str) -> Optional[int]:
+            numbers = [value for value in values.get(arg, []) if value.isdigit()]
+            return int(numbers[0]) if numbers else None
+
+        filters = {field: number(arg) for field, arg in RANGE_ARGS.items()}
+
+        if SELLER_TYPE_ARG in values:
+            filters['seller_type'] = SellerType.parse(values[SELLER_TYPE_ARG][0])
+        if COUNTRY_ARG in values:
+            filters['country'] = Country.parse(values[COUNTRY_ARG][0])
+        if CAR_TYPE_ARG in values:
+            car_brand, _, car_type = values[CAR_TYPE_ARG][0].partition(';')
+            filters['car_brand'] = int(car_brand)
+            if car_type:
+                filters['car_type'] = int(car_type) if car_type.isdigit() else f';{car_type.lstrip(";")}'
+
+        base_query = [(key, value) for key, value in pairs if key not in FILTER_ARGS and key != PAGE_ARG]
+        base_url = urlunparse((parsed.scheme, parsed.netloc, parsed.path, parsed.params, urlencode(base_query), ''))
+        return cls(base_url=base_url, **filters)
+
+    def split(self, dimension: Dimension) -> Optional[Tuple['SearchFilter', 'SearchFilter']]:
+        """
+        Split the search in halves of dimension's range. Open range is split as if its max was the dimension's open
+        ceiling (or twice the min if it is higher and dimension is not bounded), the upper half stays open.
+
+        :param dimension: Range to split
+        :return: Lower and upper half or None if range can't be split anymore
+        """
+        min_value = getattr(self, dimension.min_arg)
+        min_value = dimension.floor if min_value is None else min_value
+        max_value = getattr(self, dimension.max_arg)
+        if max_value is not None:
+            upper_value = max_value
+        elif dimension.bounded:
+            upper_value = dimension.open_ceiling
+        else:
+            upper_value = max(dimension.open_ceiling, 2 * min_value)
+
+        if upper_value <= min_value:
+            return None
+
+        mid_value = (min_value + upper_value) // 2
+        lower = self._replace(**{dimension.min_arg: min_value, dimension.max_arg: mid_value})
+        upper = self._replace(**{dimension.min_arg: mid_value + 1, dimension.max_arg: max_value})
+        return lower, upper
+
+
+def canonical_search_url(url: str, with_page: bool = True) -> str:
+    """
+    Canonical form of search URL, the same search has the same form regardless of parameters order and encoding.
+    Shared by response cache and memoized counts, so both match equivalent searches alike.
+
+    :param url: Search URL
+    :param with_page: [Optional] Keep selection of the page, first page is the same as search without page selection
+    :return: Canonical URL of the search (and its page)
+    :raise ValueError: if URL's filters can't be parsed
+    """
+    canonical = SearchFilter.from_url(url).url
+    pages = [value for key, value in parse_qsl(urlparse(url).query) if key == PAGE_ARG]
+    if with_page and pages and pages[0] != '1':
+        canonical += ('&' if urlparse(canonical).query else '?') + urlencode([(PAGE_ARG, pages[0])])
+    return canonical
@@ -0,0 +1,255 @@
+import importlib.util
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Set
+
+JSON = 'json'
+JSONL = 'jsonl'
+PARQUET = 'parquet'
+
+DEFAULT_MAX_RECORDS = 10000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_SECONDS = 5 * 60
+
+AD_COLUMNS = ('id', 'title', 'loc', 'rbt_features')
+EXTRA_TECHNICAL_DATA_COLUMN = 'technical_data_extra'
+
+
+class Sink:
+    """
+    Destination of scraped ads. Sinks may buffer ads, so every method returns ids of ads which are durably written
+    by the call - only these can be marked as done.
+    """
+
+    def write(self, record: Dict) -> List[str]:
+        """
+        :param record: Scraped ad
+        :return: Ids of ads written by the call
+        """
+        raise NotImplementedError
+
+    def unchanged(self, ad_id: str) -> List[str]:
+        """
+        Ad was seen again, but it didn't change since it was written, so it was not scraped
+
+        :param ad_id: Ad's id
+        :return: Ids of ads written by the call
+        """
+        return [ad_id]
+
+    def flush(self) -> List[str]:
+        """
+        Write buffered ads
+
+        :return: Ids of ads written by the call
+        """
+        return []
+
+    def close(self):
+        """
+        Flush buffered ads
+        """
+        self.flush()
+
+
+class JsonFileSink(Sink):
+    """
+    Writes every ad to its own ad_{id}.json file
+    """
+
+    def __init__(self, directory: str = '.'):
+        """
+        :param directory: Directory with ad's files, created if missing
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def write(self, record: Dict) -> List[str]:
+        with open(os.path.join(self.directory, f'ad_{record["id"]}.json'), 'w+') as file:
+            json.dump(record, file)
+        return [record['id']]
+
+
+class TeeSink(Sink):
+    """
+    Writes every ad to all given sinks, ad is written once all of them wrote it
+    """
+
+    def __init__(self, *sinks: Sink):
+        self.sinks = sinks
+        self._written: List[Set[str]] = [set() for _ in sinks]
+
+    def write(self, record: Dict) -> List[str]:
+        return self._collect([sink.write(record) for sink in self.sinks])
+
+    def unchanged(self, ad_id: str) -> List[str]:
+        return self._collect([sink.unchanged(ad_id) for sink in self.sinks])
+
+    def flush(self) -> List[str]:
+        return self._collect([sink.flush() for sink in self.sinks])
+
+    def _collect(self, sinks_ids: List[List[str]]) -> List[str]:
+        for written, ids in zip(self._written, sinks_ids):
+            written.update(ids)
+        ids = [ad_id for ad_id in set().union(*sinks_ids) if all(ad_id in written for written in self._written)]
+        for written in self._written:
+            written.difference_update(ids)
+        return ids
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class BatchSink(Sink):
+    """
+    Buffers ads and writes them in part files. Part is rolled over when it reaches max number of records, max size or
+    max age. Every part is written to a temporary file and renamed, so readers never see partially written parts.
+    """
+    extension: str
+
+    def __init__(self, directory: str = '.', max_records: int = DEFAULT_MAX_RECORDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_seconds: float = DEFAULT_MAX_SECONDS):
+        """
+        :param directory: Directory with part files, created if missing
+        :param max_records: Max number of ads in a part
+        :param max_bytes: Max (approximate) size of a part in bytes
+        :param max_seconds: Max time in seconds between the first ad of a part and its flush
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self._records: List[Dict] = []
+        self._size = 0
+        self._started_at: Optional[float] = None
+        self._part_n = 0
+        self._prefix = f'ads-{time.strftime("%Y%m%d%H%M%S")}-{os.getpid()}'
+
+    def write(self, record: Dict) -> List[str]:
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+
+        self._records.append(record)
+        self._size += self._record_size(record)
+
+        if len(self._records) >= self.max_records or self._size >= self.max_bytes or \
+                time.monotonic() - self._started_at >= self.max_seconds:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[str]:
+        """
+        Write buffered ads as a new part
+
+        :return: Ids of written ads
+        """
+        if not self._records:
+            return []
+
+        path = os.path.join(self.directory, f'{self._prefix}-{self._part_n:05d}.{self.extension}')
+        tmp_path = path + '.tmp'
+        self._write_part(tmp_path, self._records)
+        os.replace(tmp_path, path)
+
+        ids = [record['id'] for record in self._records]
+        self._part_n += 1
+        self._records = []
+        self._size = 0
+        self._started_at = None
+        return ids
+
+    @staticmethod
+    def _record_size(record: Dict) -> int:
+        return len(json.dumps(record))
+
+    def _write_part(self, path: str, records: List[Dict]):
+        raise NotImplementedError
+
+
+class JsonlSink(BatchSink):
+    """
+    Writes ads as JSON lines part files
+    """
+    extension = 'jsonl'
+
+    def _write_part(self, path: str, records: List[Dict]):
+        with open(path, 'w') as file:
+            for record in records:
+                file.write(json.dumps(record) + '\n')
+
+
+def column_name(key: str) -> str:
+    """
+    :param key: Technical data key, ex. "Cubic Capacity"
+    :return: Name of its column in flat outputs, ex. "cubic_capacity"
+    """
+    name = re.sub(r'\W+', '_', key.strip().lower()).strip('_')
+    return f'technical_{name}' if name in AD_COLUMNS or name == EXTRA_TECHNICAL_DATA_COLUMN else name
+
+
+class ParquetSink(BatchSink):
+    """
+    Writes ads as Parquet part files with a flat schema: ad's columns and one string column per technical data key.
+    Technical data columns are fixed by the first part, so all parts share a schema and the whole directory can be
+    read at once. Keys which appear later are kept as JSON in technical_data_extra column.
+    """
+    extension = 'parquet'
+
+    def __init__(self, *args, **kwargs):
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError('Parquet output requires pyarrow, install it with: pip install pyarrow')
+        super().__init__(*args, **kwargs)
+        self.technical_columns: Optional[Dict[str, str]] = None
+
+    def _write_part(self, path: str, records: List[Dict]):
+        import pandas
+        import pyarrow
+        import pyarrow.parquet
+
+        if self.technical_columns is None:
+            keys = sorted({key for record in records for key in (record.get('technical_data') or {})})
+            self.technical_columns = {}
+            for key in keys:
+                column = column_name(key)
+                while column in self.technical_columns.values():
+                    column += '_'
+                self.technical_columns[key] = column
+
+        rows = []
+        for record in records:
+            technical_data = record.get('technical_data') or {}
+            row = {column: record.get(column) for column in AD_COLUMNS}
+            row.update({column: technical_data.get(key) for key, column in self.technical_columns.items()})
+            extra = {key: value for key, value in technical_data.items() if key not in self.technical_columns}
+            row[EXTRA_TECHNICAL_DATA_COLUMN] = json.dumps(extra) if extra else None
+            rows.append(row)
+
+        # Explicit schema, otherwise columns which are empty in the whole part would get null type
+        schema = pyarrow.schema(
+            [(column, pyarrow.string()) for column in AD_COLUMNS if column != 'rbt_features'] +
+            [('rbt_features', pyarrow.list_(pyarrow.string()))] +
+            [(column, pyarrow.string()) for column in [*self.technical_columns.values(), EXTRA_TECHNICAL_DATA_COLUMN]]
+        )
+        frame = pandas.DataFrame(rows, columns=schema.names)
+        table = pyarrow.Table.from_pandas(frame, schema=schema, preserve_index=False)
+        pyarrow.parquet.write_table(table, path)
+
+
+def create_sink(output_format: str = JSON, directory: str = '.', **kwargs) -> Sink:
+    """
+    :param output_format: JSON, JSONL or PARQUET
+    :param directory: Output directory
+    :param kwargs: BatchSink's rollover arguments, ignored by JSON sink
+    :return: Sink writing ads in given format
+    """
+    if output_format == JSON:
+        return JsonFileSink(directory)
+    if output_format == JSONL:
+        return JsonlSink(directory, **kwargs)
+    if output_format == PARQUET:
+        return ParquetSink(directory, **kwargs)
+    raise ValueError(f'Unknown output format {output_format}')
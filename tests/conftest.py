@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture
+def mock_site():
+    """
+    Local mock of mobile.de with the shared fetcher pointed at it
+    """
+    from fetcher import configure_fetcher
+    from mock_server import MockSite
+
+    site = MockSite(pages=2).start()
+    configure_fetcher(requests_per_second=None)
+    yield site
+    configure_fetcher()
+    site.stop()
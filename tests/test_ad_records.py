@@ -0,0 +1,39 @@
+from ad_records import AdStore
+from history import content_hash
+
+ADS = [
+    {
+        'id': '300000001',
+        'title': 'Audi A4 Avant',
+        'rbt_features': ['Navigation', 'ABS', 'Navigation'],
+        'technical_data': {'Kilometerstand': '10.000 km', 'Leistung': '110 kW (150 PS)'},
+        'loc': 'DE-10115 Berlin',
+    },
+    {
+        'id': '0042',
+        'title': 'BMW 320d',
+        'rbt_features': ['ABS', 'Klimaanlage'],
+        'technical_data': {'Leistung': '140 kW (190 PS)', 'Farbe': 'Schwarz', 'Kilometerstand': '5.000 km'},
+        'loc': 'DE-80331 München',
+    },
+    {'id': None, 'title': None, 'rbt_features': None, 'technical_data': None, 'loc': None},
+    {'id': '300000003', 'title': 'Opel Corsa', 'rbt_features': [], 'technical_data': {}, 'loc': ''},
+]
+
+
+def test_round_trip_keeps_ads_and_their_hashes():
+    store = AdStore(ADS)
+    decoded = list(store)
+
+    assert decoded == ADS
+    assert [list(ad['technical_data'] or ()) for ad in decoded] == [list(ad['technical_data'] or ()) for ad in ADS]
+    assert [content_hash(ad) for ad in decoded] == [content_hash(ad) for ad in ADS]
+
+
+def test_feature_queries():
+    store = AdStore(ADS)
+
+    assert [record.id for record in store.with_features('ABS', 'Navigation')] == [300000001]
+    assert [record.id for record in store.with_features('ABS')] == [300000001, '0042']
+    assert list(store.with_features('Unknown')) == []
+    assert store.feature_counts() == {'Navigation': 1, 'ABS': 2, 'Klimaanlage': 1}
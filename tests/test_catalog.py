@@ -0,0 +1,51 @@
+import logging
+
+import pytest
+
+from catalog import CATALOG
+
+
+def test_exact_lookup_is_case_and_punctuation_insensitive(caplog):
+    with caplog.at_level(logging.WARNING):
+        assert CATALOG.find('Mercedes-Benz').brand == 'mercedes-benz'
+        assert CATALOG.find('audi', 'rs 7').name == 'RS7'
+    assert not caplog.records
+
+
+def test_unique_prefix_is_resolved_and_logged(caplog):
+    with caplog.at_level(logging.WARNING):
+        model = CATALOG.find('merc', 'class c')
+    assert (model.brand, model.name) == ('mercedes-benz', 'Class C')
+    assert 'mercedes-benz' in caplog.text
+
+
+def test_close_misspelling_is_resolved_and_logged(caplog):
+    with caplog.at_level(logging.WARNING):
+        assert CATALOG.find('audi', 'a44').name == 'A4'
+    assert 'A4' in caplog.text
+
+
+def test_ambiguous_prefix_is_rejected():
+    with pytest.raises(ValueError, match='RS2, RS3'):
+        CATALOG.find('audi', 'rs')
+
+
+def test_inexact_names_are_rejected_without_fuzzy_matching():
+    with pytest.raises(ValueError, match='Unknown'):
+        CATALOG.find('audi', 'a44', fuzzy=False)
+
+
+def test_bare_code_brand_has_no_models():
+    model = CATALOG.find('alfa romeo')
+    assert (model.name, model.code, model.brand_code) == (None, None, 900)
+    assert CATALOG.expand('alfa romeo') == (model,)
+    with pytest.raises(ValueError):
+        CATALOG.find('alfa romeo', 'giulia')
+
+
+def test_series_is_expanded_into_submodels():
+    series = CATALOG.find('bmw', 'series 1')
+    assert series.is_series
+    submodels = CATALOG.expand('bmw', 'series 1')
+    assert submodels and all(model.series == 'Series 1' and not model.is_series for model in submodels)
+    assert CATALOG.expand('bmw', '116') == (CATALOG.find('bmw', '116'),)
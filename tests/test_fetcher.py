@@ -0,0 +1,36 @@
+import pytest
+import requests
+
+from fetcher import AdaptiveRateController, Fetcher
+
+HOST = 'suchen.mobile.de'
+
+
+def test_healthy_responses_raise_rate():
+    controller = AdaptiveRateController(1.0)
+    controller.on_response(HOST, 200, 0.1)
+    assert controller.rate(HOST) > 1.0
+
+
+@pytest.mark.parametrize('status_code', [500, 502, 504])
+def test_server_errors_keep_rate(status_code):
+    controller = AdaptiveRateController(1.0)
+    controller.on_response(HOST, status_code, 0.1)
+    assert controller.rate(HOST) == 1.0
+
+
+@pytest.mark.parametrize('status_code', [403, 429, 503])
+def test_block_statuses_decrease_rate(status_code):
+    controller = AdaptiveRateController(1.0)
+    controller.on_response(HOST, status_code, 0.1)
+    assert controller.rate(HOST) < 1.0
+
+
+def test_failed_requests_decrease_rate():
+    controller = AdaptiveRateController(1.0)
+    fetcher = Fetcher(requests_per_second=None, max_retries=0, controller=controller)
+    with pytest.raises(requests.ConnectionError):
+        fetcher.get('http://127.0.0.1:1/fahrzeuge/details.html?id=1')
+    fetcher.close()
+    assert controller.blocks == {'127.0.0.1:1': 1}
+    assert controller.rate('127.0.0.1:1') < 1.0
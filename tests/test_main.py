@@ -0,0 +1,56 @@
+from ad_index import AdIndex
+from incremental import SearchStateStore
+from main import crawl_with_queue, update_search_state
+from sinks import Sink
+from work_queue import WorkQueue, AD_TASK, DONE
+
+
+class ListSink(Sink):
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        self.records.append(record)
+        return [record['id']]
+
+
+def test_queue_crawl_waits_for_tasks_in_flight_of_other_workers(tmp_path, mock_site):
+    path = str(tmp_path / 'queue.sqlite')
+    url = f'{mock_site.base_url}/fahrzeuge/details.html?id=1'
+    other_worker = WorkQueue(path)
+    other_worker.worker = 'other-host:1'
+    other_worker.put_many(AD_TASK, [('1', url)])
+    other_worker.claim(AD_TASK)
+
+    sink = ListSink()
+    queue = WorkQueue(path, lease_timeout=0.5)
+    crawl_with_queue(queue, ad_index=AdIndex(), sink=sink, poll_interval=0.1)
+
+    assert [record['id'] for record in sink.records] == ['1']
+    assert queue.counts(AD_TASK) == {DONE: 1}
+    other_worker.close()
+    queue.close()
+
+
+def test_search_state_stops_before_ads_which_were_not_written(tmp_path):
+    state = SearchStateStore(str(tmp_path / 'state.json'))
+    search_url = 'https://suchen.mobile.de/fahrzeuge/search.html?vc=Car'
+    state.update(search_url, ['3'])
+    ad_index = AdIndex()
+    for ad_id in ('10', '8', '7', '5'):
+        ad_index.add(ad_id)
+
+    update_search_state(state, search_url, ['10', '9', '8', '7', '6', '5', '4'], ad_index)
+    assert state.newest_ids(search_url) == ['3']
+
+    ad_index.add('4')
+    update_search_state(state, search_url, ['10', '9', '8', '7', '6', '5', '4'], ad_index)
+    assert state.newest_ids(search_url) == ['5', '4', '3']
+
+    update_search_state(state, search_url, ['12', '11'], AdIndex())
+    assert state.newest_ids(search_url) == ['5', '4', '3']
+
+    ad_index.add('6')
+    ad_index.add('9')
+    update_search_state(state, search_url, ['10', '9', '8', '7', '6', '5', '4'], ad_index)
+    assert state.newest_ids(search_url) == ['10', '9', '8', '7', '6', '5', '4', '3']
@@ -0,0 +1,21 @@
+from normalize import normalize_ads
+
+ADS = [
+    {'id': '1', 'title': 'A', 'loc': 'X', 'rbt_features': [],
+     'technical_data': {'price': '12.345', 'Cubic Capacity': '1.395 cm³', 'Power': '92 kW (125 PS)',
+                        'Door Count': '4/5', 'First Registration': '04/2016', 'Colour': 'Black'}},
+    {'id': '2', 'title': 'B', 'loc': 'Y', 'rbt_features': ['ABS'],
+     'technical_data': {'price': '999', 'Door Count': '2/3', 'Colour': 'Red'}},
+]
+
+
+def test_normalize_ads():
+    frame = normalize_ads(ADS)
+
+    assert list(frame['id']) == [1, 2]
+    assert list(frame['price']) == [12345, 999]
+    assert frame['cubic_capacity'][0] == 1395
+    assert (frame['power_kw'][0], frame['power_ps'][0]) == (92, 125)
+    assert str(frame['first_registration'][0].date()) == '2016-04-01'
+    assert list(frame['number_of_doors']) == ['4/5', '2/3']
+    assert frame['colour'].dtype == 'category'
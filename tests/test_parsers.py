@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from parsers import create_parser, BS4, LXML
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures')
+AD_URL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=300000000'
+
+# Expected values are outputs of the original BeautifulSoup scrape_car and search page helpers
+AD = {
+    'id': '300000000',
+    'title': 'Volkswagen Golf 1.4 TSI Highline',
+    'rbt_features': [
+        'ABS', 'Alloy wheels', 'Bluetooth', 'Central locking', 'Cruise control', 'Electric side mirror',
+        'Electric windows', 'ESP', 'Hands-free kit', 'Isofix', 'Multifunction steering wheel', 'Navigation system',
+        'On-board computer', 'Power Assisted Steering', 'Rain sensor', 'Start-stop system', 'Tuner/radio',
+        'Immobilizer', 'Traction control', 'Light sensor',
+    ],
+    'technical_data': {
+        'price': '12.345', 'Mileage': '123.456 km', 'Cubic Capacity': '1.395 cm³', 'Power': '92 kW (125 PS)',
+        'Fuel': 'Petrol', 'Number of Seats': '5', 'Door Count': '4/5', 'Gearbox': 'Manual gearbox',
+        'Emission Class': 'Euro6', 'First Registration': '04/2016', 'Number of Vehicle Owners': '2', 'HU': '04/2022',
+        'Climatisation': 'Automatic climatisation', 'Parking sensors': 'Front, Rear', 'Airbags': 'Front and Side',
+        'Colour (Manufacturer)': 'Deep Black', 'Colour': 'Black', 'Interior Design': 'Cloth, Black',
+        'Category': 'Saloon', 'Vehicle condition': 'Used vehicle',
+    },
+    'loc': 'DE-10115 Berlin',
+}
+HEADER = '<h1 id="rbt-ad-title">T</h1><p id="rbt-seller-address">A</p>'
+MALFORMED_ADS = [
+    ('', None),
+    ('<html></html>', None),
+    (
+        '<div class="cBox-body cBox-body--technical-data">'
+        '<div class="g-col-6 vip-price-rating__tech-details">1.000 €</div></div>' + HEADER,
+        {'id': '300000000', 'title': 'T', 'rbt_features': None, 'technical_data': {'price': '1.000'}, 'loc': 'A'},
+    ),
+    (
+        '<div id="rbt-features"><div class="g-col-6">A<div class="g-col-6">B</div></div></div>' + HEADER,
+        {'id': '300000000', 'title': 'T', 'rbt_features': ['AB', 'B'], 'technical_data': None, 'loc': 'A'},
+    ),
+    (
+        '<div class="cBox-body  cBox-body--technical-data"><div class="g-row u-margin-bottom-9">'
+        '<div class="g-col-6">K</div><div class="g-col-6">V<div class="g-row u-margin-bottom-9">'
+        '<div class="g-col-6">K2</div><div class="g-col-6">V2</div></div></div></div></div>' + HEADER,
+        {'id': '300000000', 'title': 'T', 'rbt_features': None, 'technical_data': {'K': 'VK2V2', 'K2': 'V2'},
+         'loc': 'A'},
+    ),
+]
+
+
+def _fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name)) as file:
+        return file.read()
+
+
+@pytest.fixture(params=[LXML, BS4])
+def parser(request):
+    return create_parser(request.param)
+
+
+def test_parse_car(parser):
+    assert parser.parse_car(AD_URL, _fixture('ad.html')) == AD
+
+
+@pytest.mark.parametrize('content, expected', MALFORMED_ADS)
+def test_parse_malformed_car(parser, content, expected):
+    assert parser.parse_car(AD_URL, content) == expected
+
+
+def test_parse_search_page(parser):
+    content = _fixture('search.html')
+    assert parser.parse_ads_urls(content) == [
+        f'https://suchen.mobile.de/fahrzeuge/details.html?id={300000000 + n}&damageUnrepaired=NO_DAMAGE_UNREPAIRED'
+        for n in range(20)
+    ]
+    assert parser.parse_max_page_number(content) == 7
+    assert parser.parse_number_of_results(content) == 1234
+
+
+def test_parse_empty_search_page(parser):
+    assert parser.parse_ads_urls('<html></html>') == []
+    assert parser.parse_max_page_number('<html></html>') == 1
+    assert parser.parse_number_of_results('<html></html>') is None
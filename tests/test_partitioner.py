@@ -0,0 +1,46 @@
+import random
+
+from partitioner import SearchPartitioner, MAX_RESULTS, DIMENSIONS
+from search_filter import SearchFilter
+
+RANGES = [(dimension.min_arg, dimension.max_arg) for dimension in DIMENSIONS]
+
+
+def _ads():
+    rng = random.Random(0)
+
+    def ad(price):
+        return {
+            'min_price': price,
+            'min_mileage': rng.randint(0, 300000),
+            'min_first_registration': rng.randint(1990, DIMENSIONS[2].open_ceiling),
+            'min_horse_power': rng.randint(50, 400),
+        }
+
+    # Many ads at a single price can only be separated by other dimensions
+    return [ad(9999) for _ in range(5000)] + [ad(rng.randint(0, 150000)) for _ in range(10000)]
+
+
+def _matches(search, ad):
+    for min_arg, max_arg in RANGES:
+        value = ad[min_arg]
+        min_value, max_value = getattr(search, min_arg), getattr(search, max_arg)
+        if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+            return False
+    return True
+
+
+def test_partitions_are_disjoint_complete_and_small_enough():
+    ads = _ads()
+
+    def count_results(url):
+        search = SearchFilter.from_url(url)
+        return sum(1 for ad in ads if _matches(search, ad))
+
+    searches = SearchPartitioner(count_results).plan(SearchFilter())
+    counts = [count_results(search.url) for search in searches]
+
+    assert all(count <= MAX_RESULTS for count in counts)
+    assert sum(counts) == len(ads)
+    for ad in ads:
+        assert sum(1 for search in searches if _matches(search, ad)) == 1
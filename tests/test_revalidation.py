@@ -0,0 +1,33 @@
+from revalidation import RevalidationStore, page_hash
+
+AD_URL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=123'
+
+
+def test_state_is_saved_only_once_ad_is_written(tmp_path):
+    store = RevalidationStore(str(tmp_path / 'state.sqlite'))
+    content_hash = page_hash('<html>ad</html>')
+    store.list(AD_URL, 'summary')
+    store.fetched(AD_URL, '"etag"', None)
+    store.parsed(AD_URL, content_hash)
+
+    assert not store.is_content_unchanged(AD_URL, content_hash)
+    assert not store.is_listing_unchanged(AD_URL)
+
+    store.scraped('123')
+
+    assert store.is_content_unchanged(AD_URL, content_hash)
+    store.list(AD_URL, 'summary')
+    assert store.is_listing_unchanged(AD_URL)
+    assert store.request_headers(AD_URL) == {'If-None-Match': '"etag"'}
+    store.close()
+
+
+def test_discarded_ad_is_not_saved(tmp_path):
+    store = RevalidationStore(str(tmp_path / 'state.sqlite'))
+    content_hash = page_hash('<html>ad</html>')
+    store.parsed(AD_URL, content_hash)
+    store.discard(AD_URL)
+    store.scraped('123')
+
+    assert not store.is_content_unchanged(AD_URL, content_hash)
+    store.close()
@@ -0,0 +1,53 @@
+import pytest
+
+from cache import normalize_url
+from counts import count_key
+from partitioner import DIMENSIONS
+from search_filter import SearchFilter, SellerType, Country
+
+FILTERS = [
+    SearchFilter(),
+    SearchFilter(min_price=1000, max_price=5000),
+    SearchFilter(min_horse_power=100, max_first_registration=2010, min_mileage=0, max_mileage=150000),
+    SearchFilter(seller_type=SellerType.DEALER, country=Country.GERMANY, car_brand=1900, car_type=8),
+]
+
+
+@pytest.mark.parametrize('search', FILTERS)
+def test_url_round_trip(search):
+    assert SearchFilter.from_url(search.url) == search
+    assert SearchFilter.from_url(search.url + '&pageNumber=3') == search
+
+
+@pytest.mark.parametrize('dimension', DIMENSIONS, ids=lambda dimension: dimension.name)
+@pytest.mark.parametrize('search', FILTERS)
+def test_split_is_disjoint_and_complete(search, dimension):
+    halves = search.split(dimension)
+    assert halves is not None
+    lower, upper = halves
+
+    lower_min, lower_max = getattr(lower, dimension.min_arg), getattr(lower, dimension.max_arg)
+    upper_min, upper_max = getattr(upper, dimension.min_arg), getattr(upper, dimension.max_arg)
+    search_min = getattr(search, dimension.min_arg)
+    assert lower_min == (dimension.floor if search_min is None else search_min)
+    assert lower_min <= lower_max
+    assert upper_min == lower_max + 1
+    assert upper_max == getattr(search, dimension.max_arg)
+    if dimension.bounded:
+        assert lower_max < dimension.open_ceiling
+
+
+def test_bounded_dimension_is_not_split_past_its_ceiling():
+    dimension = next(dimension for dimension in DIMENSIONS if dimension.name == 'first_registration')
+    search = SearchFilter(min_first_registration=dimension.open_ceiling)
+    assert search.split(dimension) is None
+
+
+def test_cache_and_counts_share_canonical_form():
+    url = SearchFilter(min_price=1000, max_price=5000).url
+    reordered = 'https://suchen.mobile.de/fahrzeuge/search.html?' + '&'.join(reversed(url.split('?')[1].split('&')))
+
+    assert normalize_url(reordered) == normalize_url(url) == url
+    assert normalize_url(url + '&pageNumber=1') == url
+    assert normalize_url(url + '&pageNumber=2') != url
+    assert count_key(reordered + '&pageNumber=2') == count_key(url)
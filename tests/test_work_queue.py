@@ -0,0 +1,81 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from work_queue import WorkQueue, AD_TASK, DONE, IN_FLIGHT, PENDING
+
+URL = 'https://suchen.mobile.de/fahrzeuge/details.html?id=1'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def test_abandoned_task_is_claimed_again_after_lease_timeout(tmp_path, clock):
+    path = str(tmp_path / 'queue.sqlite')
+    worker = WorkQueue(path, lease_timeout=60)
+    worker.put_many(AD_TASK, [('1', URL)])
+
+    [task] = worker.claim(AD_TASK)
+    assert task.attempts == 1
+
+    other_worker = WorkQueue(path, lease_timeout=60)
+    clock[0] += 59
+    assert other_worker.claim(AD_TASK) == []
+
+    clock[0] += 2
+    [task] = other_worker.claim(AD_TASK)
+    assert task.attempts == 2
+    assert other_worker.counts(AD_TASK) == {IN_FLIGHT: 1}
+
+    other_worker.mark_done(task)
+    clock[0] += 120
+    assert other_worker.claim(AD_TASK) == []
+    assert other_worker.counts(AD_TASK) == {DONE: 1}
+    worker.close()
+    other_worker.close()
+
+
+def test_failed_task_is_retried_up_to_max_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.sqlite'), max_attempts=2)
+    queue.put_many(AD_TASK, [('1', URL)])
+
+    for attempt in (1, 2):
+        [task] = queue.claim(AD_TASK)
+        assert task.attempts == attempt
+        queue.mark_failed(task, 'error')
+
+    assert queue.claim(AD_TASK) == []
+    queue.close()
+
+
+def test_tasks_of_dead_worker_are_released(tmp_path):
+    path = str(tmp_path / 'queue.sqlite')
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+
+    crashed = WorkQueue(path)
+    crashed.worker = f'{socket.gethostname()}:{process.pid}'
+    running = WorkQueue(path)
+    running.worker = f'{socket.gethostname()}:{os.getppid()}'
+    remote = WorkQueue(path)
+    remote.worker = f'other-host:{process.pid}'
+    crashed.put_many(AD_TASK, [(str(n), URL) for n in range(6)])
+    for queue in (crashed, running, remote):
+        queue.claim(AD_TASK, 2)
+
+    queue = WorkQueue(path)
+    assert queue.claim(AD_TASK) == []
+    assert queue.release_dead() == 2
+    assert queue.counts(AD_TASK) == {PENDING: 2, IN_FLIGHT: 4}
+    assert sorted(task.attempts for task in queue.claim(AD_TASK, 10)) == [2, 2]
+    assert queue.release_dead() == 0
+    for queue in (crashed, running, remote, queue):
+        queue.close()
@@ -0,0 +1,173 @@
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+SEARCH_TASK = 'search'
+AD_TASK = 'ad'
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_TIMEOUT = 10 * 60
+
+
+class Task(NamedTuple):
+    kind: str
+    key: str
+    url: str
+    attempts: int
+
+
+def _is_running(worker: str) -> bool:
+    pid = worker.rpartition(':')[2]
+    if not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class WorkQueue:
+    """
+    Durable queue of crawl tasks (search pages and ads) kept in SQLite. Every task is pending, in flight, done or
+    failed. Claiming is atomic, so several worker processes may pull tasks from the same file. Failed tasks are retried
+    up to max attempts and tasks left in flight by a dead worker are claimed again after lease timeout.
+    """
+
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 lease_timeout: float = DEFAULT_LEASE_TIMEOUT):
+        """
+        :param path: Path to SQLite file with queue, created if missing
+        :param max_attempts: Max number of attempts of a single task
+        :param lease_timeout: Time in seconds after which task in flight is considered abandoned
+        """
+        self.max_attempts = max_attempts
+        self.lease_timeout = lease_timeout
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            'kind TEXT NOT NULL, key TEXT NOT NULL, url TEXT NOT NULL, status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, updated_at REAL NOT NULL, error TEXT, '
+            'PRIMARY KEY (kind, key))'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS tasks_status ON tasks (kind, status, updated_at)')
+
+    @contextmanager
+    def _transaction(self):
+        # Write lock is taken up front, so concurrent claims of different workers can't interleave
+        self._connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        self._connection.execute('COMMIT')
+
+    def put_many(self, kind: str, tasks: Iterable[Tuple[str, str]]) -> int:
+        """
+        Add pending tasks, tasks already known to the queue (in any status) are ignored
+
+        :param kind: Kind of tasks - SEARCH_TASK or AD_TASK
+        :param tasks: Pairs of task's key and URL
+        :return: Number of added tasks
+        """
+        now = time.time()
+        with self._transaction():
+            cursor = self._connection.executemany(
+                'INSERT OR IGNORE INTO tasks (kind, key, url, status, updated_at) VALUES (?, ?, ?, ?, ?)',
+                ((kind, key, url, PENDING, now) for key, url in tasks)
+            )
+        return cursor.rowcount
+
+    def claim(self, kind: str, limit: int = 1) -> List[Task]:
+        """
+        Atomically take tasks to process: pending ones, failed ones with attempts left and abandoned ones
+
+        :param kind: Kind of tasks - SEARCH_TASK or AD_TASK
+        :param limit: Max number of claimed tasks
+        :return: List of claimed tasks, empty if there is nothing to do
+        """
+        now = time.time()
+        with self._transaction():
+            rows = self._connection.execute(
+                'SELECT key, url, attempts FROM tasks WHERE kind = ? AND ('
+                'status = ? OR (status = ? AND attempts < ?) OR (status = ? AND updated_at < ?)) '
+                'ORDER BY attempts, updated_at LIMIT ?',
+                (kind, PENDING, FAILED, self.max_attempts, IN_FLIGHT, now - self.lease_timeout, limit)
+            ).fetchall()
+            self._connection.executemany(
+                'UPDATE tasks SET status = ?, attempts = attempts + 1, worker = ?, updated_at = ? '
+                'WHERE kind = ? AND key = ?',
+                ((IN_FLIGHT, self.worker, now, kind, key) for key, _, _ in rows)
+            )
+
+        return [Task(kind, key, url, attempts + 1) for key, url, attempts in rows]
+
+    def mark_done(self, task: Task):
+        self._set_status(task, DONE)
+
+    def mark_failed(self, task: Task, error: str = None):
+        self._set_status(task, FAILED, error)
+
+    def _set_status(self, task: Task, status: str, error: str = None):
+        with self._transaction():
+            self._connection.execute(
+                'UPDATE tasks SET status = ?, error = ?, updated_at = ? WHERE kind = ? AND key = ?',
+                (status, error, time.time(), task.kind, task.key)
+            )
+
+    def release_dead(self) -> int:
+        """
+        Return tasks left in flight by dead workers of this host (ex. crashed runs) to pending, so they don't wait
+        for lease timeout. Workers of other hosts can't be checked, their tasks are claimed again after the timeout.
+
+        :return: Number of released tasks
+        """
+        host = socket.gethostname()
+        with self._transaction():
+            rows = self._connection.execute(
+                'SELECT DISTINCT worker FROM tasks WHERE status = ? AND worker LIKE ?', (IN_FLIGHT, f'{host}:%')
+            ).fetchall()
+            dead = [(worker,) for worker, in rows if worker != self.worker and not _is_running(worker)]
+            cursor = self._connection.executemany(
+                'UPDATE tasks SET status = ?, worker = NULL WHERE status = ? AND worker = ?',
+                ((PENDING, IN_FLIGHT, worker) for worker, in dead)
+            )
+        return cursor.rowcount
+
+    def has_tasks(self, kind: str) -> bool:
+        """
+        :param kind: Kind of tasks - SEARCH_TASK or AD_TASK
+        :return: True if queue knows any task of given kind
+        """
+        return self._connection.execute('SELECT 1 FROM tasks WHERE kind = ? LIMIT 1', (kind,)).fetchone() is not None
+
+    def counts(self, kind: str) -> Dict[str, int]:
+        """
+        :param kind: Kind of tasks - SEARCH_TASK or AD_TASK
+        :return: Number of tasks of given kind per status
+        """
+        rows = self._connection.execute('SELECT status, COUNT(*) FROM tasks WHERE kind = ? GROUP BY status', (kind,))
+        return dict(rows.fetchall())
+
+    def clear(self):
+        """
+        Remove all tasks
+        """
+        with self._transaction():
+            self._connection.execute('DELETE FROM tasks')
+
+    def close(self):
+        self._connection.close()